@@ -1,33 +1,187 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, g
 from flask_cors import CORS
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, func, or_
+from sqlalchemy.orm import sessionmaker, joinedload
+from sqlalchemy import create_engine, func, and_
 from datetime import datetime, date
+import json
 import os
+import re
+import uuid
+from itertools import islice
 
 from config import Config
 from models import (Base, User, EquipmentType, StockItem, EquipmentInstance, 
-                   Movement, Invoice, StatusEnum, MovementTypeEnum, init_db, get_session)
-from import_service import ImportService
-from utils import require_api_key, allowed_file
+                   Movement, Invoice, ImportedFile, StatusEnum, MovementTypeEnum, init_db, get_session,
+                   fold_text)
+from import_service import ImportService, TABLE_EXTENSIONS
+from import_jobs import ImportJobManager
+from counters import CounterChanges, stock_counters, ensure_counters
+from report_cache import ReportCache
+from autocomplete import Autocomplete
+from search import text_search, ranked_search
+from concurrent.futures import ThreadPoolExecutor
+from utils import (require_api_key, allowed_file, save_upload, detach_upload, upload_path, archive_upload,
+                   UploadRequest)
 
 app = Flask(__name__)
+# Arquivos enviados vão direto para um SpooledUpload, com o SHA-256 calculado na recepção
+app.request_class = UploadRequest
 app.config.from_object(Config)
 Config.init_app(app)
 
 # Configurar CORS
 CORS(app, origins=Config.CORS_ORIGINS)
 
-# Inicializar banco de dados
-engine = init_db(app.config['SQLALCHEMY_DATABASE_URI'])
-Session = sessionmaker(bind=engine)
+# Banco de dados (aberto em start())
+engine = None
+Session = sessionmaker()
+
+# Relatórios em cache até o próximo commit que grave no banco (rotas, importações)
+report_cache = ReportCache(max_entries=Config.REPORT_CACHE_SIZE)
+report_cache.watch(Session)
+
+# Índices de prefixo em memória do autocompletar, atualizados pelos commits
+autocomplete = Autocomplete(rebuild_delay=Config.AUTOCOMPLETE_REBUILD_DELAY)
+autocomplete.watch(Session)
+
+def start():
+    """Abrir o banco (migrações pendentes, contadores) e montar o autocompletar"""
+    global engine
+    engine = init_db(app.config['SQLALCHEMY_DATABASE_URI'], **Config.database_options())
+    Session.configure(bind=engine)
+    
+    # Bancos criados antes dos contadores do estoque: montar a partir das tabelas
+    with Session() as startup_session:
+        if ensure_counters(startup_session):
+            startup_session.commit()
+    
+    autocomplete.refresh()
+
+# Os processos da normalização paralela importam este módulo de novo, como
+# __mp_main__ (multiprocessing), mas só usam o import_service: não abrem o banco
+if __name__ != '__mp_main__':
+    start()
+
+def db_session():
+    """Sessão do banco da requisição atual (criada sob demanda, uma por requisição)"""
+    if 'db_session' not in g:
+        g.db_session = Session()
+    return g.db_session
+
+@app.after_request
+def commit_db_session(response):
+    """Confirmar a transação da requisição; respostas de erro são desfeitas"""
+    session = g.get('db_session')
+    if session is None:
+        return response
+    if response.status_code >= 400:
+        session.rollback()
+        return response
+    try:
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        response = jsonify({'error': str(e)})
+        response.status_code = 500
+    return response
+
+@app.teardown_appcontext
+def close_db_session(exception=None):
+    """Fechar a sessão da requisição, inclusive após exceções e retornos antecipados"""
+    session = g.pop('db_session', None)
+    if session is not None:
+        if exception is not None:
+            session.rollback()
+        session.close()
+
+# Importações em segundo plano
+import_jobs = ImportJobManager(Session, max_workers=Config.IMPORT_WORKERS,
+                               reports_folder=Config.IMPORT_ERRORS_FOLDER)
+# Arquivamento (fora do caminho da importação) dos uploads lidos da memória
+upload_archiver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+
+def error_report_path(report_id):
+    """Caminho do CSV de linhas rejeitadas de uma importação"""
+    return os.path.join(Config.IMPORT_ERRORS_FOLDER, f'{report_id}.csv')
+
+def error_report_url(report_id):
+    """URL de download do relatório de erros, se ele existir"""
+    if os.path.exists(error_report_path(report_id)):
+        return f'/api/import/errors/{report_id}'
+    return None
+
+def receive_upload(file, prefix, ext):
+    """
+    Receber o arquivo enviado
+    
+    Por padrão ele é gravado em uploads/; com streaming (?stream=1 ou
+    IMPORT_STREAM_UPLOADS) fica em memória e o importador lê direto dele.
+    Retorna (origem para o importador, caminho em uploads/ ou None, sha256).
+    """
+    default = '1' if Config.IMPORT_STREAM_UPLOADS else '0'
+    if request.values.get('stream', default) == '1':
+        upload = detach_upload(file, ext)
+        filepath = None
+        if Config.IMPORT_ARCHIVE_UPLOADS:
+            filepath = upload_path(app.config['UPLOAD_FOLDER'], prefix, ext, upload.sha256)
+        return upload, filepath, upload.sha256
+    
+    filepath, sha256 = save_upload(file, app.config['UPLOAD_FOLDER'], prefix, ext)
+    return filepath, filepath, sha256
+
+def release_upload(source, filepath):
+    """Liberar um upload lido da memória, arquivando-o em segundo plano se configurado"""
+    if isinstance(source, str):
+        return
+    if filepath:
+        upload_archiver.submit(archive_upload, source, filepath)
+    else:
+        source.close()
+
+def find_imported_file(kind, sha256):
+    """Importação bem-sucedida anterior do mesmo conteúdo, se houver"""
+    return db_session().query(ImportedFile).filter_by(sha256=sha256, kind=kind).first()
+
+def remember_import(session, kind, sha256, filename, filepath, stats, report_id):
+    """
+    Registrar o hash de um arquivo importado com sucesso
+    
+    Com linhas descartadas por falha na gravação, o arquivo não é registrado:
+    reenviá-lo deve tentar gravar essas linhas de novo, e não responder com
+    as estatísticas em cache.
+    """
+    if stats.get('discarded'):
+        return
+    record = session.query(ImportedFile).filter_by(sha256=sha256, kind=kind).first()
+    if not record:
+        record = ImportedFile(sha256=sha256, kind=kind)
+        session.add(record)
+    
+    record.filename = filename
+    record.path = filepath
+    record.stats = json.dumps(stats)
+    record.report_id = report_id
+    record.imported_at = datetime.now()
+    session.commit()
+
+def cached_import_response(record):
+    """Resposta para um arquivo idêntico a um já importado"""
+    data = record.to_dict()
+    return jsonify({
+        'success': True,
+        'message': 'Arquivo já importado anteriormente',
+        'cached': True,
+        'stats': data['stats'],
+        'imported_at': data['imported_at'],
+        'error_report': error_report_url(record.report_id) if record.report_id else None
+    }), 200
 
 # ============== ROTAS DE IMPORTAÇÃO ==============
 
 @app.route('/api/import/users', methods=['POST'])
 @require_api_key
 def import_users():
-    """Importar usuários de CSV"""
+    """Importar usuários de CSV, Parquet ou Arrow IPC"""
     if 'file' not in request.files:
         return jsonify({'error': 'Nenhum arquivo enviado'}), 400
     
@@ -38,20 +192,60 @@ def import_users():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
     
-    filename = f"users_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    # Arquivos são identificados pelo hash do conteúdo; reenvios idênticos não são reprocessados
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    ext = ext if ext in TABLE_EXTENSIONS else 'csv'
+    source, filepath, sha256 = receive_upload(file, 'users', ext)
+    if request.values.get('force') != '1':
+        previous = find_imported_file('users', sha256)
+        if previous:
+            release_upload(source, filepath)
+            return cached_import_response(previous)
+    
+    # Importação em blocos (opcional): ?chunk_size=N ou campo do formulário
+    chunk_size = request.values.get('chunk_size', type=int)
+    # Normalização paralela em N processos (opcional)
+    workers = request.values.get('workers', type=int, default=Config.IMPORT_PROCESSES)
+    # Importação delta: não regravar usuários iguais aos da última importação
+    delta = request.values.get('delta') == '1'
+    
+    def run(import_service, chunk_size=chunk_size):
+        try:
+            if ext in TABLE_EXTENSIONS:
+                return import_service.import_users_from_parquet(source, chunk_size=chunk_size,
+                                                                workers=workers, delta=delta)
+            return import_service.import_users_from_csv(source, chunk_size=chunk_size,
+                                                        workers=workers, delta=delta)
+        finally:
+            release_upload(source, filepath)
+    
+    # Por padrão a importação roda em segundo plano; ?sync=1 mantém o modo antigo
+    if request.values.get('sync') != '1':
+        job = import_jobs.submit(
+            'users', source, file.filename,
+            lambda service: run(service, chunk_size or Config.IMPORT_CHUNK_SIZE),
+            on_success=lambda session, job: remember_import(
+                session, 'users', sha256, file.filename, filepath, job.stats, job.id
+            )
+        )
+        return jsonify({
+            'success': True,
+            'message': 'Importação iniciada',
+            'job_id': job.id,
+            'job': job.to_dict()
+        }), 202
     
     try:
-        session = Session()
-        import_service = ImportService(session)
-        stats = import_service.import_users_from_csv(filepath)
-        session.close()
+        report_id = uuid.uuid4().hex
+        session = db_session()
+        stats = run(ImportService(session, error_report=error_report_path(report_id)))
+        remember_import(session, 'users', sha256, file.filename, filepath, stats, report_id)
         
         return jsonify({
             'success': True,
             'message': 'Importação concluída',
-            'stats': stats
+            'stats': stats,
+            'error_report': error_report_url(report_id)
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -59,7 +253,7 @@ def import_users():
 @app.route('/api/import/equipment', methods=['POST'])
 @require_api_key
 def import_equipment():
-    """Importar equipamentos de Excel ou CSV"""
+    """Importar equipamentos de Excel, CSV, Parquet ou Arrow IPC"""
     if 'file' not in request.files:
         return jsonify({'error': 'Nenhum arquivo enviado'}), 400
     
@@ -71,35 +265,210 @@ def import_equipment():
         return jsonify({'error': 'Tipo de arquivo não permitido'}), 400
     
     ext = file.filename.rsplit('.', 1)[1].lower()
-    filename = f"equipment_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    source, filepath, sha256 = receive_upload(file, 'equipment', ext)
+    if request.values.get('force') != '1':
+        previous = find_imported_file('equipment', sha256)
+        if previous:
+            release_upload(source, filepath)
+            return cached_import_response(previous)
+    
+    chunk_size = request.values.get('chunk_size', type=int)
+    workers = request.values.get('workers', type=int, default=Config.IMPORT_PROCESSES)
+    delta = request.values.get('delta') == '1'
+    
+    def run(import_service, chunk_size=chunk_size):
+        try:
+            if ext in TABLE_EXTENSIONS:
+                return import_service.import_equipment_from_parquet(source, chunk_size=chunk_size,
+                                                                    workers=workers, delta=delta)
+            if ext in ['xlsx', 'xls']:
+                return import_service.import_equipment_from_excel(source, chunk_size=chunk_size,
+                                                                  workers=workers, delta=delta)
+            return import_service.import_equipment_from_csv(source, chunk_size=chunk_size,
+                                                            workers=workers, delta=delta)
+        finally:
+            release_upload(source, filepath)
+    
+    if request.values.get('sync') != '1':
+        job = import_jobs.submit(
+            'equipment', source, file.filename,
+            lambda service: run(service, chunk_size or Config.IMPORT_CHUNK_SIZE),
+            on_success=lambda session, job: remember_import(
+                session, 'equipment', sha256, file.filename, filepath, job.stats, job.id
+            )
+        )
+        return jsonify({
+            'success': True,
+            'message': 'Importação iniciada',
+            'job_id': job.id,
+            'job': job.to_dict()
+        }), 202
     
     try:
-        session = Session()
-        import_service = ImportService(session)
-        
-        if ext in ['xlsx', 'xls']:
-            stats = import_service.import_equipment_from_excel(filepath)
-        else:
-            stats = import_service.import_equipment_from_csv(filepath)
-        
-        session.close()
+        report_id = uuid.uuid4().hex
+        session = db_session()
+        stats = run(ImportService(session, error_report=error_report_path(report_id)))
+        remember_import(session, 'equipment', sha256, file.filename, filepath, stats, report_id)
         
         return jsonify({
             'success': True,
             'message': 'Importação concluída',
-            'stats': stats
+            'stats': stats,
+            'error_report': error_report_url(report_id)
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/import/jobs/<job_id>', methods=['GET'])
+def import_job_status(job_id):
+    """Progresso de uma importação em segundo plano"""
+    job = import_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Importação não encontrada'}), 404
+    
+    result = job.to_dict()
+    result['error_report'] = error_report_url(job.id)
+    return jsonify(result), 200
+
+@app.route('/api/import/errors/<report_id>', methods=['GET'])
+@require_api_key
+def import_error_report(report_id):
+    """Baixar o CSV com as linhas rejeitadas de uma importação"""
+    if not re.fullmatch(r'[0-9a-f]{32}', report_id) or not os.path.exists(error_report_path(report_id)):
+        return jsonify({'error': 'Relatório não encontrado'}), 404
+    
+    return send_file(
+        os.path.abspath(error_report_path(report_id)),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name=f'erros_importacao_{report_id}.csv'
+    )
+
+# Relacionamentos usados por to_dict, carregados na mesma consulta (sem N+1)
+STOCK_ITEM_LOAD = (joinedload(StockItem.equipment_type),)
+INSTANCE_LOAD = (
+    joinedload(EquipmentInstance.stock_item).joinedload(StockItem.equipment_type),
+    joinedload(EquipmentInstance.current_user)
+)
+
+# ============== PAGINAÇÃO ==============
+
+def serialize_rows(session, rows):
+    """Serialização padrão das listagens: to_dict de cada linha"""
+    return [row.to_dict() for row in rows]
+
+def list_payload(query, id_column, serialize=serialize_rows):
+    """
+    Corpo da resposta de uma listagem
+    
+    Com `limit` ou `cursor`, a listagem é paginada por keyset no id
+    (WHERE id > cursor ORDER BY id LIMIT n), então o custo de cada página
+    não depende da profundidade. Sem eles, mantém o formato antigo (lista
+    completa), para clientes existentes. `serialize(session, linhas)`
+    transforma as linhas em dicionários.
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return serialize(query.session, query.all())
+    
+    limit = request.args.get('limit', type=int) or Config.DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, Config.MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    if cursor:
+        if not cursor.isdigit():
+            raise ValueError('Cursor inválido')
+        query = query.filter(id_column > int(cursor))
+    
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+    return {
+        'items': serialize(query.session, rows[:limit]),
+        'next_cursor': next_cursor,
+        'limit': limit
+    }
+
+# ============== STREAMING ==============
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def wants_stream():
+    """Formato de streaming pedido pelo cliente: 'ndjson', 'array' ou None"""
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    if request.args.get('stream') == '1':
+        return 'array'
+    return None
+
+def stream_rows(query, id_column, fmt, serialize=serialize_rows):
+    """
+    Listagem escrita à medida que as linhas chegam do banco
+    
+    As linhas vêm em lotes (yield_per) e são serializadas e enviadas lote a
+    lote, então a memória não cresce com o tamanho do resultado. `fmt` é
+    'ndjson' (um objeto por linha) ou 'array' (array JSON em blocos). Os
+    filtros `cursor` e `limit` continuam valendo, sem envelope de paginação.
+    """
+    cursor = request.args.get('cursor')
+    if cursor:
+        if not cursor.isdigit():
+            raise ValueError('Cursor inválido')
+        query = query.filter(id_column > int(cursor))
+    query = query.order_by(id_column)
+    limit = request.args.get('limit', type=int)
+    if limit:
+        query = query.limit(max(1, limit))
+    
+    batch_size = Config.STREAM_BATCH_SIZE
+    
+    def generate():
+        # O corpo é gerado depois do fim da requisição (e do fechamento da
+        # sessão dela), então a leitura usa uma sessão própria
+        session = Session()
+        try:
+            rows = iter(query.with_session(session).yield_per(batch_size))
+            first = True
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                items = [app.json.dumps(item) for item in serialize(session, batch)]
+                if fmt == 'ndjson':
+                    yield '\n'.join(items) + '\n'
+                else:
+                    yield ('[' if first else ',') + ','.join(items)
+                first = False
+            if fmt == 'array':
+                yield '[]' if first else ']'
+        finally:
+            session.close()
+    
+    mimetype = NDJSON_MIMETYPE if fmt == 'ndjson' else 'application/json'
+    return Response(generate(), mimetype=mimetype)
+
+def list_response(query, id_column, serialize=serialize_rows):
+    """Resposta de uma listagem: em streaming, se pedido, ou JSON completo/paginado"""
+    fmt = wants_stream()
+    if fmt:
+        return stream_rows(query, id_column, fmt, serialize)
+    return jsonify(list_payload(query, id_column, serialize)), 200
+
 # ============== ROTAS DE USUÁRIOS ==============
 
+def folded_filter(column, value):
+    """
+    Filtro sobre uma coluna normalizada (*_norm), sem diferenciar acentos e maiúsculas
+    
+    Por padrão compara o valor inteiro; com ?match=prefix, casa o início.
+    O prefixo vira um intervalo (>= 'sao' AND < 'sap'), que usa o índice.
+    """
+    folded = fold_text(value) or ''
+    if request.args.get('match') == 'prefix' and folded:
+        return and_(column >= folded, column < folded[:-1] + chr(ord(folded[-1]) + 1))
+    return column == folded
+
 @app.route('/api/users', methods=['GET'])
 def get_users():
     """Listar usuários com filtros"""
-    session = Session()
+    session = db_session()
     
     # Parâmetros de filtro
     city = request.args.get('city')
@@ -110,31 +479,25 @@ def get_users():
     query = session.query(User)
     
     if city:
-        query = query.filter(User.cidade.ilike(f'%{city}%'))
+        query = query.filter(folded_filter(User.cidade_norm, city))
     if cargo:
-        query = query.filter(User.cargo.ilike(f'%{cargo}%'))
+        query = query.filter(folded_filter(User.cargo_norm, cargo))
     if setor:
-        query = query.filter(User.setor.ilike(f'%{setor}%'))
+        query = query.filter(folded_filter(User.setor_norm, setor))
     if q:
-        query = query.filter(
-            or_(
-                User.nome.ilike(f'%{q}%'),
-                User.cpf.ilike(f'%{q}%'),
-                User.matricula.ilike(f'%{q}%')
-            )
-        )
-    
-    users = query.all()
-    session.close()
+        # Índice FTS5 (trigram) sobre nome, cpf e matrícula
+        query = query.filter(text_search(User, q))
     
-    return jsonify([user.to_dict() for user in users]), 200
+    try:
+        return list_response(query, User.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Obter detalhes de um usuário"""
-    session = Session()
+    session = db_session()
     user = session.query(User).get(user_id)
-    session.close()
     
     if not user:
         return jsonify({'error': 'Usuário não encontrado'}), 404
@@ -146,7 +509,7 @@ def get_user(user_id):
 def create_user():
     """Criar novo usuário"""
     data = request.json
-    session = Session()
+    session = db_session()
     
     try:
         user = User(
@@ -159,13 +522,10 @@ def create_user():
             matricula=data.get('matricula')
         )
         session.add(user)
-        session.commit()
+        session.flush()
         result = user.to_dict()
-        session.close()
         return jsonify(result), 201
     except Exception as e:
-        session.rollback()
-        session.close()
         return jsonify({'error': str(e)}), 400
 
 # ============== ROTAS DE TIPOS DE EQUIPAMENTOS ==============
@@ -173,31 +533,25 @@ def create_user():
 @app.route('/api/equipment-types', methods=['GET'])
 def get_equipment_types():
     """Listar tipos de equipamentos"""
-    session = Session()
+    session = db_session()
     q = request.args.get('q')
     
     query = session.query(EquipmentType)
     
     if q:
-        query = query.filter(
-            or_(
-                EquipmentType.nome.ilike(f'%{q}%'),
-                EquipmentType.marca.ilike(f'%{q}%'),
-                EquipmentType.modelo.ilike(f'%{q}%')
-            )
-        )
-    
-    types = query.all()
-    session.close()
+        query = query.filter(text_search(EquipmentType, q))
     
-    return jsonify([t.to_dict() for t in types]), 200
+    try:
+        return list_response(query, EquipmentType.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/equipment-types', methods=['POST'])
 @require_api_key
 def create_equipment_type():
     """Criar novo tipo de equipamento"""
     data = request.json
-    session = Session()
+    session = db_session()
     
     try:
         eq_type = EquipmentType(
@@ -207,41 +561,97 @@ def create_equipment_type():
             especificacoes=data.get('especificacoes')
         )
         session.add(eq_type)
-        session.commit()
+        session.flush()
         result = eq_type.to_dict()
-        session.close()
         return jsonify(result), 201
     except Exception as e:
-        session.rollback()
-        session.close()
         return jsonify({'error': str(e)}), 400
 
 # ============== ROTAS DE ESTOQUE ==============
 
+# Ids por consulta das contagens (páginas maiores são divididas em várias)
+INSTANCE_COUNTS_MAX_IDS = 500
+
+def instance_counts(session, stock_item_ids):
+    """
+    Instâncias por status de cada item de estoque, em consultas agregadas
+    
+    GROUP BY (stock_item_id, status) com IN (ids), respondido pelo índice
+    ix_equipment_instances_stock_item_status sem ler a tabela; o custo
+    acompanha o tamanho da página, nunca o da tabela.
+    """
+    counts = {item_id: {status.name: 0 for status in StatusEnum} for item_id in stock_item_ids}
+    ids = list(counts)
+    for start in range(0, len(ids), INSTANCE_COUNTS_MAX_IDS):
+        query = session.query(
+            EquipmentInstance.stock_item_id, EquipmentInstance.status, func.count()
+        ).filter(
+            EquipmentInstance.stock_item_id.in_(ids[start:start + INSTANCE_COUNTS_MAX_IDS])
+        ).group_by(EquipmentInstance.stock_item_id, EquipmentInstance.status)
+        for item_id, status, count in query:
+            counts[item_id][status.name] = count
+    return counts
+
+def serialize_stock_items(session, items):
+    """Itens de estoque com as contagens de instâncias por status"""
+    counts = instance_counts(session, [item.id for item in items])
+    result = []
+    for item in items:
+        data = item.to_dict()
+        data['instance_counts'] = counts[item.id]
+        result.append(data)
+    return result
+
+def parse_date_arg(name):
+    """Data (AAAA-MM-DD) de um parâmetro da URL, ou None"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Data inválida em {name} (use AAAA-MM-DD)')
+
 @app.route('/api/stock', methods=['GET'])
 def get_stock():
-    """Listar estoque"""
-    session = Session()
+    """Listar estoque com filtros"""
+    session = db_session()
     
-    available = request.args.get('available')
+    available = request.args.get('available') in ('1', 'true')
     type_id = request.args.get('type_id')
+    origem = request.args.get('origem')
+    q = request.args.get('q')  # Nome, marca ou modelo do tipo
     
-    query = session.query(StockItem)
+    query = session.query(StockItem).options(*STOCK_ITEM_LOAD)
     
+    if available:
+        # Itens com pelo menos uma instância disponível (EXISTS pelo índice stock_item_id, status)
+        query = query.filter(StockItem.equipment_instances.any(EquipmentInstance.status == StatusEnum.disponivel))
     if type_id:
         query = query.filter(StockItem.equipment_type_id == type_id)
+    if origem:
+        query = query.filter(StockItem.origem == origem)
+    if q:
+        types = session.query(EquipmentType.id).filter(text_search(EquipmentType, q))
+        query = query.filter(StockItem.equipment_type_id.in_(types))
     
-    items = query.all()
-    session.close()
-    
-    return jsonify([item.to_dict() for item in items]), 200
+    try:
+        nota_from = parse_date_arg('nota_from')
+        nota_to = parse_date_arg('nota_to')
+        if nota_from:
+            query = query.filter(StockItem.nota_data >= nota_from)
+        if nota_to:
+            query = query.filter(StockItem.nota_data <= nota_to)
+        return list_response(query, StockItem.id, serialize_stock_items)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/stock', methods=['POST'])
 @require_api_key
 def create_stock_item():
     """Registrar nova entrada de estoque"""
     data = request.json
-    session = Session()
+    session = db_session()
     
     try:
         # Criar item de estoque
@@ -268,13 +678,15 @@ def create_stock_item():
             )
             session.add(instance)
         
-        session.commit()
+        counters = CounterChanges()
+        counters.add_instances(stock_item.equipment_type_id, StatusEnum.disponivel, len(instances_data))
+        counters.add_value(stock_item.equipment_type_id, stock_item.valor_total)
+        counters.apply(session)
+        
+        session.flush()
         result = stock_item.to_dict()
-        session.close()
         return jsonify(result), 201
     except Exception as e:
-        session.rollback()
-        session.close()
         return jsonify({'error': str(e)}), 400
 
 # ============== ROTAS DE EQUIPAMENTOS (INSTÂNCIAS) ==============
@@ -282,22 +694,25 @@ def create_stock_item():
 @app.route('/api/equipment-instances', methods=['GET'])
 def get_equipment_instances():
     """Listar instâncias de equipamentos"""
-    session = Session()
+    session = db_session()
     
     status = request.args.get('status')
     user_id = request.args.get('user_id')
+    q = request.args.get('q')  # Patrimonial ou serial
     
-    query = session.query(EquipmentInstance)
+    query = session.query(EquipmentInstance).options(*INSTANCE_LOAD)
     
     if status:
         query = query.filter(EquipmentInstance.status == StatusEnum[status])
     if user_id:
         query = query.filter(EquipmentInstance.current_user_id == user_id)
+    if q:
+        query = query.filter(text_search(EquipmentInstance, q))
     
-    instances = query.all()
-    session.close()
-    
-    return jsonify([inst.to_dict() for inst in instances]), 200
+    try:
+        return list_response(query, EquipmentInstance.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 # ============== ROTAS DE DESTINAÇÃO ==============
 
@@ -306,7 +721,7 @@ def get_equipment_instances():
 def assign_equipment():
     """Destinar equipamento a usuário"""
     data = request.json
-    session = Session()
+    session = db_session()
     
     try:
         instance_id = data.get('equipment_instance_id')
@@ -314,7 +729,7 @@ def assign_equipment():
         note = data.get('note', '')
         
         # Buscar instância
-        instance = session.query(EquipmentInstance).get(instance_id)
+        instance = session.get(EquipmentInstance, instance_id, options=INSTANCE_LOAD)
         if not instance:
             return jsonify({'error': 'Equipamento não encontrado'}), 404
         
@@ -327,8 +742,11 @@ def assign_equipment():
             return jsonify({'error': 'Usuário não encontrado'}), 404
         
         # Atualizar instância
+        counters = CounterChanges()
+        counters.change_status(instance.status, StatusEnum.alocado)
+        counters.apply(session)
         instance.status = StatusEnum.alocado
-        instance.current_user_id = to_user_id
+        instance.current_user = user
         instance.assigned_at = datetime.now()
         
         # Registrar movimento
@@ -340,9 +758,8 @@ def assign_equipment():
         )
         session.add(movement)
         
-        session.commit()
+        session.flush()
         result = instance.to_dict()
-        session.close()
         
         return jsonify({
             'success': True,
@@ -350,8 +767,6 @@ def assign_equipment():
             'equipment': result
         }), 200
     except Exception as e:
-        session.rollback()
-        session.close()
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/return', methods=['POST'])
@@ -359,14 +774,14 @@ def assign_equipment():
 def return_equipment():
     """Devolver equipamento"""
     data = request.json
-    session = Session()
+    session = db_session()
     
     try:
         instance_id = data.get('equipment_instance_id')
         note = data.get('note', '')
         
         # Buscar instância
-        instance = session.query(EquipmentInstance).get(instance_id)
+        instance = session.get(EquipmentInstance, instance_id, options=INSTANCE_LOAD)
         if not instance:
             return jsonify({'error': 'Equipamento não encontrado'}), 404
         
@@ -376,8 +791,11 @@ def return_equipment():
         from_user_id = instance.current_user_id
         
         # Atualizar instância
+        counters = CounterChanges()
+        counters.change_status(instance.status, StatusEnum.disponivel)
+        counters.apply(session)
         instance.status = StatusEnum.disponivel
-        instance.current_user_id = None
+        instance.current_user = None
         instance.assigned_at = None
         
         # Registrar movimento
@@ -389,9 +807,8 @@ def return_equipment():
         )
         session.add(movement)
         
-        session.commit()
+        session.flush()
         result = instance.to_dict()
-        session.close()
         
         return jsonify({
             'success': True,
@@ -399,75 +816,178 @@ def return_equipment():
             'equipment': result
         }), 200
     except Exception as e:
-        session.rollback()
-        session.close()
         return jsonify({'error': str(e)}), 400
 
-# ============== ROTAS DE RELATÓRIOS ==============
+# ============== ROTA DE BUSCA ==============
 
-@app.route('/api/reports/stock-summary', methods=['GET'])
-def stock_summary():
-    """Resumo do estoque"""
-    session = Session()
+SEARCH_KINDS = {
+    'users': (User, ()),
+    'equipment_types': (EquipmentType, ()),
+    'equipment': (EquipmentInstance, INSTANCE_LOAD),
+}
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """Busca por trecho em usuários, tipos e instâncias, ordenada por relevância"""
+    session = db_session()
     
-    # Total de equipamentos
-    total = session.query(func.count(EquipmentInstance.id)).scalar()
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'Informe o texto da busca (q)'}), 400
     
-    # Por status
-    disponivel = session.query(func.count(EquipmentInstance.id)).filter(
-        EquipmentInstance.status == StatusEnum.disponivel
-    ).scalar()
+    kind = request.args.get('kind')
+    if kind and kind not in SEARCH_KINDS:
+        return jsonify({'error': f"Tipo de busca inválido: {kind}"}), 400
     
-    alocado = session.query(func.count(EquipmentInstance.id)).filter(
-        EquipmentInstance.status == StatusEnum.alocado
-    ).scalar()
+    limit = request.args.get('limit', type=int) or 20
+    limit = max(1, min(limit, Config.MAX_PAGE_SIZE))
     
-    em_manutencao = session.query(func.count(EquipmentInstance.id)).filter(
-        EquipmentInstance.status == StatusEnum.em_manutencao
-    ).scalar()
+    result = {'q': q}
+    for name, (model, options) in SEARCH_KINDS.items():
+        if kind and name != kind:
+            continue
+        result[name] = [row.to_dict() for row in ranked_search(session, model, q, limit, options)]
     
-    baixado = session.query(func.count(EquipmentInstance.id)).filter(
-        EquipmentInstance.status == StatusEnum.baixado
-    ).scalar()
+    return jsonify(result), 200
+
+# ============== ROTAS DE AUTOCOMPLETAR ==============
+
+def autocomplete_response(kind, model, options=(), status=None):
+    """Os primeiros registros do índice em memória que começam com ?q=, lidos pela PK"""
+    session = db_session()
     
-    # Valor total investido
-    valor_total = session.query(func.sum(StockItem.valor_total)).scalar() or 0
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'Informe o texto a completar (q)'}), 400
     
-    session.close()
+    limit = request.args.get('limit', type=int) or Config.AUTOCOMPLETE_LIMIT
+    limit = max(1, min(limit, Config.AUTOCOMPLETE_MAX_LIMIT))
     
-    return jsonify({
-        'total': total,
-        'disponivel': disponivel,
-        'alocado': alocado,
-        'em_manutencao': em_manutencao,
-        'baixado': baixado,
-        'valor_total_investido': valor_total
-    }), 200
+    ids = autocomplete.search(session, kind, q, limit, status)
+    if not ids:
+        return jsonify([]), 200
+    position = {row_id: i for i, row_id in enumerate(ids)}
+    rows = session.query(model).options(*options).filter(model.id.in_(ids)).all()
+    if status is not None:
+        # O índice pode estar um commit atrás do banco
+        rows = [row for row in rows if row.status == status]
+    rows.sort(key=lambda row: position[row.id])
+    return jsonify([row.to_dict() for row in rows]), 200
+
+@app.route('/api/autocomplete/users', methods=['GET'])
+def autocomplete_users():
+    """Usuários cujo nome (qualquer palavra) ou matrícula começa com ?q="""
+    return autocomplete_response('users', User)
+
+@app.route('/api/autocomplete/equipment', methods=['GET'])
+def autocomplete_equipment():
+    """Instâncias cujo patrimonial ou serial começa com ?q= (filtro opcional: ?status=)"""
+    status = request.args.get('status')
+    if status and status not in StatusEnum.__members__:
+        return jsonify({'error': f"Status inválido: {status}"}), 400
+    return autocomplete_response('equipment', EquipmentInstance, INSTANCE_LOAD,
+                                 StatusEnum[status] if status else None)
+
+# ============== ROTA DE FACETAS ==============
+
+def user_facet(session, column, folded_column):
+    """
+    Valores distintos de uma coluna de usuários, com contagens
+    
+    Agrupa pela coluna normalizada, como os filtros da listagem: grafias com
+    e sem acento contam juntas. Contagem e menor id de cada grupo vêm só do
+    índice *_norm; o valor mostrado é a grafia desse usuário (busca pela PK).
+    """
+    groups = session.query(
+        func.min(User.id).label('user_id'), func.count().label('count')
+    ).filter(folded_column.isnot(None)).group_by(folded_column).subquery()
+    
+    rows = session.query(column, groups.c.count).join(
+        groups, groups.c.user_id == User.id
+    ).order_by(folded_column)
+    return [{'value': value, 'count': count} for value, count in rows]
+
+def status_facet(session):
+    """Instâncias por status (índice de status)"""
+    counts = dict(session.query(EquipmentInstance.status, func.count()).group_by(EquipmentInstance.status).all())
+    return [{'value': status.name, 'label': status.value, 'count': counts.get(status, 0)} for status in StatusEnum]
+
+def equipment_type_facet(session):
+    """Tipos de equipamento com o número de instâncias de cada um"""
+    # Instâncias por item de estoque (índice stock_item_id, status) e depois por tipo
+    per_item = session.query(
+        EquipmentInstance.stock_item_id.label('stock_item_id'), func.count().label('count')
+    ).group_by(EquipmentInstance.stock_item_id).subquery()
+    per_type = session.query(
+        StockItem.equipment_type_id.label('equipment_type_id'), func.sum(per_item.c.count).label('count')
+    ).join(per_item, per_item.c.stock_item_id == StockItem.id).group_by(StockItem.equipment_type_id).subquery()
+    
+    rows = session.query(EquipmentType, func.coalesce(per_type.c.count, 0)).outerjoin(
+        per_type, per_type.c.equipment_type_id == EquipmentType.id
+    ).order_by(EquipmentType.nome, EquipmentType.id)
+    return [{
+        'value': eq_type.id,
+        'label': ' '.join(part for part in (eq_type.nome, eq_type.marca, eq_type.modelo) if part),
+        'count': count
+    } for eq_type, count in rows]
+
+FACETS = {
+    'cidade': lambda session: user_facet(session, User.cidade, User.cidade_norm),
+    'cargo': lambda session: user_facet(session, User.cargo, User.cargo_norm),
+    'setor': lambda session: user_facet(session, User.setor, User.setor_norm),
+    'status': status_facet,
+    'equipment_type': equipment_type_facet,
+}
+
+@app.route('/api/facets', methods=['GET'])
+@report_cache.cached
+def facets():
+    """Valores distintos, com contagens, para montar os filtros (?fields=cidade,status)"""
+    session = db_session()
+    
+    fields = request.args.get('fields')
+    names = fields.split(',') if fields else list(FACETS)
+    unknown = [name for name in names if name not in FACETS]
+    if unknown:
+        return jsonify({'error': f"Faceta inválida: {', '.join(unknown)}"}), 400
+    
+    return jsonify({name: FACETS[name](session) for name in names}), 200
+
+# ============== ROTAS DE RELATÓRIOS ==============
+
+@app.route('/api/reports/stock-summary', methods=['GET'])
+@report_cache.cached
+def stock_summary():
+    """Resumo do estoque"""
+    session = db_session()
+    
+    # Contadores mantidos pelas escritas: leitura de poucas linhas
+    return jsonify(stock_counters(session)), 200
 
 @app.route('/api/reports/user/<int:user_id>', methods=['GET'])
 def user_equipment_report(user_id):
     """Equipamentos em uso por um usuário"""
-    session = Session()
+    session = db_session()
     
     user = session.query(User).get(user_id)
     if not user:
         return jsonify({'error': 'Usuário não encontrado'}), 404
     
-    equipment = session.query(EquipmentInstance).filter(
+    equipment = session.query(EquipmentInstance).options(*INSTANCE_LOAD).filter(
         EquipmentInstance.current_user_id == user_id
     ).all()
-    
-    session.close()
-    
-    return jsonify({
+    result = {
         'user': user.to_dict(),
         'equipment': [eq.to_dict() for eq in equipment]
-    }), 200
+    }
+    
+    return jsonify(result), 200
 
 @app.route('/api/reports/value-summary', methods=['GET'])
+@report_cache.cached
 def value_summary():
     """Resumo de valores investidos"""
-    session = Session()
+    session = db_session()
     
     # Valor total por tipo de equipamento
     summary = session.query(
@@ -480,8 +1000,6 @@ def value_summary():
         EquipmentType.id
     ).all()
     
-    session.close()
-    
     result = []
     for item in summary:
         result.append({
@@ -495,9 +1013,10 @@ def value_summary():
     return jsonify(result), 200
 
 @app.route('/api/reports/movements', methods=['GET'])
+@report_cache.cached
 def movements_report():
     """Histórico de movimentações"""
-    session = Session()
+    session = db_session()
     
     limit = int(request.args.get('limit', 100))
     
@@ -505,8 +1024,6 @@ def movements_report():
         Movement.date.desc()
     ).limit(limit).all()
     
-    session.close()
-    
     return jsonify([m.to_dict() for m in movements]), 200
 
 # ============== ROTA DE HEALTH CHECK ==============
@@ -0,0 +1,289 @@
+"""
+Autocompletar (busca por prefixo em memória)
+
+Cada tipo pesquisável tem um índice em memória com as palavras normalizadas
+(fold_text) dos campos indexados, em uma lista ordenada: as palavras que
+começam com o texto digitado ficam contíguas e são achadas por bisect, sem
+consultar o banco. Só os N registros escolhidos são lidos depois, pela PK.
+
+O índice é montado em segundo plano no início do servidor e acompanha as
+gravações: o que passa pelo flush da sessão (rotas da API) é aplicado no
+commit, registro a registro. INSERT/UPDATE em massa (importações) não dizem
+quais linhas mudaram, então o commit marca só o tipo da tabela alterada e
+agenda a remontagem dele em segundo plano, depois de um intervalo sem novas
+gravações em massa (os blocos de uma importação resultam em uma remontagem
+só); até ela terminar, as buscas usam o índice anterior.
+"""
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+from sqlalchemy import event, select
+
+from models import User, EquipmentInstance, fold_text
+
+# tipo -> (modelo, campos indexados)
+AUTOCOMPLETE_SOURCES = {
+    'users': (User, ('nome', 'matricula')),
+    'equipment': (EquipmentInstance, ('patrimonial', 'serial')),
+}
+
+@lru_cache(maxsize=65536)
+def fold_word(word):
+    """Palavra com acentos normalizada; nomes comuns se repetem e ficam em um só objeto"""
+    folded = fold_text.__wrapped__(word)
+    return sys.intern(folded) if folded else None
+
+def index_words(values):
+    """Palavras normalizadas dos valores ('Ana  Silva', 'M01' -> ('ana', 'silva', 'm01'))"""
+    words = []
+    for value in values:
+        if value:
+            for word in str(value).split():
+                folded = word.lower() if word.isascii() else fold_word(word)
+                if folded:
+                    words.append(folded)
+    return tuple(dict.fromkeys(words))
+
+class PrefixIndex:
+    """Palavras -> ids, em listas ordenadas para busca por prefixo"""
+    
+    def __init__(self, entries=()):
+        """`entries`: pares (id, palavras), em ordem crescente de id"""
+        # Duas listas paralelas (palavra, id), ordenadas por palavra e id
+        self._terms = dict(entries)
+        words = [word for terms in self._terms.values() for word in terms]
+        ids = [row_id for row_id, terms in self._terms.items() for _ in terms]
+        # Ordenação estável só pela palavra: os ids já vêm em ordem
+        order = sorted(range(len(words)), key=words.__getitem__)
+        self._words = [words[i] for i in order]
+        self._ids = [ids[i] for i in order]
+    
+    def __len__(self):
+        return len(self._terms)
+    
+    def add(self, row_id, words):
+        """Indexar (ou reindexar) um registro"""
+        self.remove(row_id)
+        for word in words:
+            position = self._position(word, row_id)
+            self._words.insert(position, word)
+            self._ids.insert(position, row_id)
+        self._terms[row_id] = words
+    
+    def remove(self, row_id):
+        """Tirar um registro do índice (se estiver nele)"""
+        for word in self._terms.pop(row_id, ()):
+            position = self._position(word, row_id)
+            if position < len(self._ids) and self._ids[position] == row_id and self._words[position] == word:
+                del self._words[position]
+                del self._ids[position]
+    
+    def search(self, q, limit, accept=None):
+        """
+        Até `limit` ids cujas palavras começam com as palavras de `q`
+        
+        A lista é percorrida a partir da palavra mais longa da busca (a mais
+        seletiva); as demais precisam ser prefixo de alguma palavra do
+        registro. `accept(id)` descarta registros (por status, por exemplo).
+        """
+        words = index_words([q])
+        if not words:
+            return []
+        lead = max(words, key=len)
+        others = [word for word in words if word != lead]
+        
+        found = []
+        seen = set()
+        position = bisect_left(self._words, lead)
+        while position < len(self._words) and len(found) < limit:
+            if not self._words[position].startswith(lead):
+                break
+            row_id = self._ids[position]
+            position += 1
+            if row_id in seen:
+                continue
+            seen.add(row_id)
+            terms = self._terms[row_id]
+            if all(any(term.startswith(word) for term in terms) for word in others):
+                if accept is None or accept(row_id):
+                    found.append(row_id)
+        return found
+    
+    def _position(self, word, row_id):
+        """Posição de (palavra, id) na ordem das listas"""
+        start = bisect_left(self._words, word)
+        end = bisect_right(self._words, word, lo=start)
+        return bisect_left(self._ids, row_id, lo=start, hi=end)
+
+class Autocomplete:
+    """Índices de prefixo de usuários e instâncias, atualizados pelas gravações"""
+    
+    def __init__(self, rebuild_delay=0.0):
+        self._indexes = {}
+        self._statuses = {}  # id da instância -> status
+        self._stale = set(AUTOCOMPLETE_SOURCES)  # tipos desatualizados
+        self._generations = dict.fromkeys(AUTOCOMPLETE_SOURCES, 0)  # avançam a cada invalidação
+        self._pending = None  # mudanças confirmadas durante uma remontagem
+        self._session_factory = None
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        # Gravações em massa seguidas (blocos de uma importação) esperam este
+        # intervalo sem novas invalidações e resultam em uma só remontagem
+        self._rebuild_delay = rebuild_delay
+        self._timer = None
+    
+    def search(self, session, kind, q, limit, status=None):
+        """
+        Ids (até `limit`) do tipo `kind` cujos campos começam com `q`
+        
+        Enquanto uma remontagem roda em segundo plano, as buscas usam os
+        índices anteriores; só a primeira montagem faz a busca esperar.
+        """
+        if kind not in self._indexes:
+            self.rebuild(session)
+        accept = None
+        if status is not None:
+            accept = lambda row_id: self._statuses.get(row_id) == status
+        with self._lock:
+            return self._indexes[kind].search(q, limit, accept)
+    
+    def refresh(self, delay=0.0):
+        """Remontar os índices desatualizados em segundo plano, com uma sessão própria"""
+        if self._session_factory is None:
+            return
+        with self._lock:
+            # Um novo pedido adia o anterior
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self._refresh)
+            self._timer.name = 'autocomplete'
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def _refresh(self):
+        session = self._session_factory()
+        try:
+            self.rebuild(session)
+        finally:
+            session.close()
+    
+    def rebuild(self, session):
+        """Montar a partir do banco os índices que estiverem desatualizados"""
+        with self._rebuild_lock:
+            with self._lock:
+                kinds = set(self._stale)
+                if not kinds:
+                    return
+                generations = {kind: self._generations[kind] for kind in kinds}
+                self._pending = []
+            
+            try:
+                indexes = {}
+                statuses = None
+                for kind in kinds:
+                    model, fields = AUTOCOMPLETE_SOURCES[kind]
+                    columns = [getattr(model, name) for name in fields]
+                    if model is EquipmentInstance:
+                        columns.append(EquipmentInstance.status)
+                        statuses = {}
+                    entries = []
+                    for row in session.execute(select(model.id, *columns).order_by(model.id)):
+                        entries.append((row[0], index_words(row[1:len(fields) + 1])))
+                        if model is EquipmentInstance:
+                            statuses[row[0]] = row[-1]
+                    indexes[kind] = PrefixIndex(entries)
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            
+            with self._lock:
+                self._indexes = {**self._indexes, **indexes}
+                if statuses is not None:
+                    self._statuses = statuses
+                # Commits feitos enquanto o banco era lido podem não estar na leitura
+                pending, self._pending = self._pending, None
+                for change in pending:
+                    if change[0] in kinds:
+                        self._apply(change)
+                # Gravação em massa durante a leitura: já há outra remontagem agendada
+                for kind in kinds:
+                    if generations[kind] == self._generations[kind]:
+                        self._stale.discard(kind)
+    
+    def invalidate(self, kinds=None):
+        """Marcar os índices (todos ou só `kinds`) como desatualizados e agendar a remontagem"""
+        with self._lock:
+            for kind in kinds or AUTOCOMPLETE_SOURCES:
+                self._stale.add(kind)
+                self._generations[kind] += 1
+        self.refresh(self._rebuild_delay)
+    
+    def apply(self, changes):
+        """Aplicar mudanças confirmadas: (tipo, id, palavras ou None se excluído, status)"""
+        with self._lock:
+            if self._pending is not None:
+                # Remontagem em andamento: aplicadas de novo sobre os índices novos
+                self._pending.extend(changes)
+            for change in changes:
+                if change[0] in self._indexes:
+                    self._apply(change)
+    
+    def _apply(self, change):
+        kind, row_id, words, status = change
+        index = self._indexes[kind]
+        if words is None:
+            index.remove(row_id)
+            self._statuses.pop(row_id, None)
+            return
+        index.add(row_id, words)
+        if status is not None:
+            self._statuses[row_id] = status
+    
+    def watch(self, session_factory):
+        """Acompanhar as gravações das sessões da fábrica (e usá-la nas remontagens)"""
+        self._session_factory = session_factory
+        models = {model: kind for kind, (model, _) in AUTOCOMPLETE_SOURCES.items()}
+        tables = {model.__tablename__: kind for model, kind in models.items()}
+        
+        def change(obj, deleted=False):
+            kind = models[type(obj)]
+            if deleted:
+                return (kind, obj.id, None, None)
+            words = index_words(getattr(obj, name) for name in AUTOCOMPLETE_SOURCES[kind][1])
+            return (kind, obj.id, words, getattr(obj, 'status', None))
+        
+        @event.listens_for(session_factory, 'after_flush')
+        def flushed(session, flush_context):
+            changes = session.info.setdefault('autocomplete_changes', {})
+            for obj in list(session.new) + list(session.dirty):
+                if type(obj) in models:
+                    changes[(type(obj), obj.id)] = change(obj)
+            for obj in session.deleted:
+                if type(obj) in models:
+                    changes[(type(obj), obj.id)] = change(obj, deleted=True)
+        
+        @event.listens_for(session_factory, 'do_orm_execute')
+        def executed(orm_execute_state):
+            # INSERT/UPDATE/DELETE em massa: não dá para saber quais linhas mudaram
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                table = getattr(orm_execute_state.statement, 'table', None)
+                if table is not None and table.name in tables:
+                    stale = orm_execute_state.session.info.setdefault('autocomplete_stale', set())
+                    stale.add(tables[table.name])
+        
+        @event.listens_for(session_factory, 'after_commit')
+        def committed(session):
+            changes = session.info.pop('autocomplete_changes', None)
+            stale = session.info.pop('autocomplete_stale', None)
+            if changes:
+                self.apply(list(changes.values()))
+            if stale:
+                self.invalidate(stale)
+        
+        @event.listens_for(session_factory, 'after_rollback')
+        def rolled_back(session):
+            session.info.pop('autocomplete_changes', None)
+            session.info.pop('autocomplete_stale', None)
@@ -7,13 +7,64 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///database.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Perfil de desempenho do SQLite (PRAGMAs aplicados a cada conexão)
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'true').lower() == 'true'
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        # Negativo = tamanho em KiB (aqui, 64MB de cache de páginas por conexão)
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # ms
+        'temp_store': 'MEMORY'
+    }
+    
+    # Pool de conexões do SQLAlchemy
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))  # segundos
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 3600))  # segundos
+    
     # Segurança - API Key simples
     API_KEY = os.environ.get('API_KEY', 'dev-key-12345')
     
     # Upload de arquivos
     UPLOAD_FOLDER = 'uploads'
+    IMPORT_ERRORS_FOLDER = os.path.join(UPLOAD_FOLDER, 'errors')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max
-    ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
+    ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls', 'parquet', 'arrow', 'feather'}
+    
+    # Importação em lote
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+    
+    # Importações em segundo plano (linhas por bloco e workers)
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 5000))
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))
+    
+    # Processos para normalização paralela das linhas (0 = desativado)
+    IMPORT_PROCESSES = int(os.environ.get('IMPORT_PROCESSES', 0))
+    
+    # Ler uploads direto da memória, sem gravar em uploads/ antes de importar
+    IMPORT_STREAM_UPLOADS = os.environ.get('IMPORT_STREAM_UPLOADS', 'false').lower() == 'true'
+    # Acima deste tamanho o upload vai para um arquivo temporário
+    IMPORT_SPOOL_MAX_SIZE = int(os.environ.get('IMPORT_SPOOL_MAX_SIZE', 8 * 1024 * 1024))
+    # Guardar em uploads/ (em segundo plano) os arquivos lidos da memória
+    IMPORT_ARCHIVE_UPLOADS = os.environ.get('IMPORT_ARCHIVE_UPLOADS', 'true').lower() == 'true'
+    
+    # Paginação das listagens (?limit=&cursor=)
+    DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+    # Linhas lidas do banco (e enviadas) por vez nas listagens em streaming
+    STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+    
+    # Cache das respostas de relatórios (entradas; 0 = desativado, mantendo ETag/304)
+    REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 256))
+    
+    # Resultados do autocompletar (/api/autocomplete/...), padrão e máximo
+    AUTOCOMPLETE_LIMIT = int(os.environ.get('AUTOCOMPLETE_LIMIT', 10))
+    AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('AUTOCOMPLETE_MAX_LIMIT', 50))
+    # Segundos sem gravações em massa antes de remontar o índice do autocompletar
+    AUTOCOMPLETE_REBUILD_DELAY = float(os.environ.get('AUTOCOMPLETE_REBUILD_DELAY', 2.0))
     
     # CORS
     CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000', 
@@ -22,7 +73,21 @@ class Config:
     # Timezone
     TIMEZONE = 'America/Sao_Paulo'
     
+    @staticmethod
+    def database_options():
+        """Argumentos de init_db: PRAGMAs do SQLite e configuração do pool"""
+        return {
+            'pragmas': Config.SQLITE_PRAGMAS if Config.SQLITE_PROFILE else None,
+            'pool_options': {
+                'pool_size': Config.DB_POOL_SIZE,
+                'max_overflow': Config.DB_MAX_OVERFLOW,
+                'pool_timeout': Config.DB_POOL_TIMEOUT,
+                'pool_recycle': Config.DB_POOL_RECYCLE
+            }
+        }
+    
     @staticmethod
     def init_app(app):
         """Inicializar configurações do app"""
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(Config.IMPORT_ERRORS_FOLDER, exist_ok=True)
@@ -0,0 +1,121 @@
+"""
+Contadores do estoque
+
+Mantidos na mesma transação das escritas (destinação, devolução, entrada de
+estoque e importações), para que o resumo do estoque seja uma leitura de
+poucas linhas em vez de COUNT/SUM sobre as tabelas inteiras.
+
+Para recalcular tudo a partir das tabelas:
+
+    python counters.py
+"""
+from collections import defaultdict
+
+from sqlalchemy import func, insert, update, delete
+
+from models import InventoryCounter, EquipmentInstance, StockItem, StatusEnum
+
+STATUS_SCOPE = 'status'
+TYPE_SCOPE = 'type'
+TOTAL_SCOPE = 'total'
+TOTAL_KEY = 'estoque'
+
+class CounterChanges:
+    """Variações dos contadores acumuladas durante uma escrita"""
+    
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0.0])
+    
+    def add_instances(self, equipment_type_id, status, count=1):
+        """Novas instâncias de um tipo, com o status informado"""
+        self._add(STATUS_SCOPE, status.name, count)
+        self._add(TYPE_SCOPE, str(equipment_type_id), count)
+        self._add(TOTAL_SCOPE, TOTAL_KEY, count)
+    
+    def change_status(self, old, new):
+        """Instância que passou de um status para outro"""
+        if old != new:
+            self._add(STATUS_SCOPE, old.name, -1)
+            self._add(STATUS_SCOPE, new.name, 1)
+    
+    def add_value(self, equipment_type_id, value):
+        """Valor (valor_total) de novos itens de estoque de um tipo"""
+        value = float(value or 0.0)
+        self._add(TYPE_SCOPE, str(equipment_type_id), value=value)
+        self._add(TOTAL_SCOPE, TOTAL_KEY, value=value)
+    
+    def apply(self, session):
+        """Somar as variações aos contadores (sem commit: vale a transação da escrita)"""
+        for (scope, key), (count, value) in self.deltas.items():
+            if not count and not value:
+                continue
+            result = session.execute(
+                update(InventoryCounter)
+                .where(InventoryCounter.scope == scope, InventoryCounter.key == key)
+                .values(count=InventoryCounter.count + count, value=InventoryCounter.value + value)
+            )
+            if result.rowcount == 0:
+                session.execute(insert(InventoryCounter).values(scope=scope, key=key, count=count, value=value))
+        self.deltas.clear()
+    
+    def _add(self, scope, key, count=0, value=0.0):
+        delta = self.deltas[(scope, key)]
+        delta[0] += count
+        delta[1] += value
+
+def stock_counters(session):
+    """Totais do estoque: instâncias por status, total e valor investido"""
+    rows = session.query(InventoryCounter).filter(
+        InventoryCounter.scope.in_((STATUS_SCOPE, TOTAL_SCOPE))
+    ).all()
+    by_status = {row.key: row.count for row in rows if row.scope == STATUS_SCOPE}
+    total = next((row for row in rows if row.scope == TOTAL_SCOPE), None)
+    
+    summary = {'total': total.count if total else 0}
+    for status in StatusEnum:
+        summary[status.name] = by_status.get(status.name, 0)
+    summary['valor_total_investido'] = total.value if total else 0
+    return summary
+
+def rebuild_counters(session):
+    """Recalcular todos os contadores a partir das tabelas (sem commit)"""
+    changes = CounterChanges()
+    
+    instances = session.query(
+        StockItem.equipment_type_id, EquipmentInstance.status, func.count(EquipmentInstance.id)
+    ).join(StockItem, EquipmentInstance.stock_item_id == StockItem.id).group_by(
+        StockItem.equipment_type_id, EquipmentInstance.status
+    )
+    for type_id, status, count in instances:
+        changes.add_instances(type_id, status or StatusEnum.disponivel, count)
+    
+    values = session.query(StockItem.equipment_type_id, func.sum(StockItem.valor_total)).group_by(
+        StockItem.equipment_type_id
+    )
+    for type_id, value in values:
+        changes.add_value(type_id, value)
+    
+    session.execute(delete(InventoryCounter))
+    changes.apply(session)
+
+def ensure_counters(session):
+    """Montar os contadores de um banco que já tinha dados antes deles existirem"""
+    if session.query(InventoryCounter.scope).first() is not None:
+        return False
+    if session.query(StockItem.id).first() is None:
+        return False
+    rebuild_counters(session)
+    return True
+
+if __name__ == '__main__':
+    from config import Config
+    from models import init_db, get_session
+    
+    engine = init_db(Config.SQLALCHEMY_DATABASE_URI, **Config.database_options())
+    session = get_session(engine)
+    rebuild_counters(session)
+    session.commit()
+    print("✓ Contadores do estoque recalculados:")
+    for key, value in stock_counters(session).items():
+        print(f"  - {key}: {value}")
+    session.close()
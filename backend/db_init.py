@@ -13,6 +13,11 @@ def create_database():
     print("  - equipment_instances")
     print("  - movements")
     print("  - invoices")
+    print("  - import_checkpoints")
+    print("  - imported_files")
+    print("  - import_fingerprints")
+    print("  - inventory_counters")
+    print("  - schema_migrations")
     return engine
 
 if __name__ == '__main__':
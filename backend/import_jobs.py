@@ -0,0 +1,107 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from import_service import ImportService
+
+class ImportJob:
+    """Importação executada em segundo plano"""
+    
+    def __init__(self, kind, filename, reports_folder=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = 'queued'
+        self.total_rows = None
+        self.rows_processed = 0
+        self.errors = 0
+        self.stats = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        # CSV com as linhas rejeitadas (criado só se houver erros)
+        self.error_report = os.path.join(reports_folder, f'{self.id}.csv') if reports_folder else None
+        self._lock = threading.Lock()
+    
+    def advance(self, rows, stats):
+        """Callback de progresso chamado pelo ImportService"""
+        with self._lock:
+            self.rows_processed += rows
+            self.errors = stats.get('errors', 0)
+    
+    def to_dict(self):
+        with self._lock:
+            end = self.finished_at or datetime.now()
+            elapsed = (end - self.started_at).total_seconds() if self.started_at else 0
+            throughput = self.rows_processed / elapsed if elapsed > 0 else 0
+            
+            eta = None
+            if self.status == 'running' and self.total_rows and throughput > 0:
+                eta = max(self.total_rows - self.rows_processed, 0) / throughput
+            
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'filename': self.filename,
+                'status': self.status,
+                'total_rows': self.total_rows,
+                'rows_processed': self.rows_processed,
+                'errors': self.errors,
+                'throughput': round(throughput, 1),
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'stats': self.stats,
+                'error': self.error,
+                'created_at': self.created_at.isoformat(),
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None
+            }
+
+class ImportJobManager:
+    """Fila de importações com pool de workers"""
+    
+    def __init__(self, session_factory, max_workers=2, reports_folder=None):
+        self.session_factory = session_factory
+        self.reports_folder = reports_folder
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import')
+        self.jobs = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, kind, file_path, filename, run, on_success=None):
+        """
+        Enfileirar uma importação
+        
+        `run` recebe um ImportService com sessão própria e devolve as estatísticas.
+        `on_success(session, job)` é chamado ao final de uma importação concluída.
+        """
+        job = ImportJob(kind, filename, self.reports_folder)
+        with self._lock:
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, file_path, run, on_success)
+        return job
+    
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+    
+    def _run(self, job, file_path, run, on_success=None):
+        session = self.session_factory()
+        try:
+            job.status = 'running'
+            job.started_at = datetime.now()
+            service = ImportService(session, progress=job.advance, error_report=job.error_report)
+            job.total_rows = service.count_rows(file_path)
+            job.stats = run(service)
+            job.errors = job.stats.get('errors', 0)
+            if on_success:
+                on_success(session, job)
+            job.status = 'finished'
+        except Exception as e:
+            session.rollback()
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.now()
+            session.close()
@@ -1,245 +1,1179 @@
 import pandas as pd
+import codecs
+import csv
+import hashlib
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from datetime import datetime
-from models import User, EquipmentType, StockItem, EquipmentInstance, StatusEnum
+from openpyxl import load_workbook
+from models import (User, EquipmentType, StockItem, EquipmentInstance, StatusEnum, ImportCheckpoint,
+                    ImportFingerprint, folded_user_fields)
+from sqlalchemy import insert, update
 from sqlalchemy.exc import IntegrityError
+from config import Config
+from counters import CounterChanges
 import json
 
+try:
+    # Dependência opcional: importação de Parquet/Arrow IPC
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Extensões lidas com pyarrow (colunas já tipadas)
+TABLE_EXTENSIONS = ('parquet', 'arrow', 'feather')
+
+# Mapear status textual da planilha
+STATUS_MAP = {
+    'disponível': StatusEnum.disponivel,
+    'disponivel': StatusEnum.disponivel,
+    'alocado': StatusEnum.alocado,
+    'em manutenção': StatusEnum.em_manutencao,
+    'em manutencao': StatusEnum.em_manutencao,
+    'baixado': StatusEnum.baixado
+}
+
+# Textos que o pd.read_excel/read_csv leem como célula vazia (na_values padrão
+# do pandas), aplicados também à leitura em blocos pelo openpyxl
+NA_STRINGS = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+})
+
+# ============== NORMALIZAÇÃO DE LINHAS ==============
+# Funções de módulo (e não métodos) para poderem rodar em outros processos.
+# A normalização opera sobre colunas inteiras (pandas) e produz os mesmos
+# valores que o tratamento célula a célula de normalize_cpf/str().strip().
+
+def normalize_cpf(cpf):
+    """Normalizar CPF"""
+    if pd.isna(cpf) or not cpf:
+        return None
+    cpf_str = str(cpf).strip()
+    # Remover caracteres não numéricos
+    cpf_clean = ''.join(filter(str.isdigit, cpf_str))
+    if len(cpf_clean) == 11:
+        return f"{cpf_clean[:3]}.{cpf_clean[3:6]}.{cpf_clean[6:9]}-{cpf_clean[9:]}"
+    return cpf_clean if cpf_clean else None
+
+def _as_text(col):
+    """Converter coluna para texto exatamente como str() faria em cada célula"""
+    # Células ausentes viram 'nan', como str() sobre a linha do iterrows
+    return col.astype(str).astype(object).where(col.notna(), 'nan')
+
+def _none_series(df):
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+def _text_column(df, column):
+    """Texto aparado; células vazias (NaN/None) ou coluna ausente viram None"""
+    if column not in df.columns:
+        return _none_series(df)
+    col = df[column]
+    return _as_text(col).str.strip().where(col.notna(), None)
+
+def normalize_cpf_column(col):
+    """Versão vetorizada de normalize_cpf para uma coluna inteira"""
+    present = col.notna() & ~col.isin(['', 0])
+    text = _as_text(col)
+    digits = text.str.replace(r'[^0-9]', '', regex=True)
+    formatted = (digits.str.slice(0, 3) + '.' + digits.str.slice(3, 6) + '.' +
+                 digits.str.slice(6, 9) + '-' + digits.str.slice(9))
+    result = digits.where(digits.str.len() != 11, formatted)
+    result = result.where(present & (digits != ''), None)
+    
+    # Dígitos fora do ASCII (str.isdigit aceita, o regex não): caminho linha a linha
+    unusual = present & text.str.contains(r'[^\x00-\x7f]', regex=True)
+    if unusual.any():
+        result[unusual] = col[unusual].map(normalize_cpf)
+    return result
+
+def _valor_column(df, errors):
+    """
+    Coerção de `valor` para float (0.0 quando vazio), como float() por célula
+    
+    Textos como 'nan' e 'inf' viram None: o SQLite gravaria NaN como NULL
+    (e o RETURNING não o casaria com a linha) e infinito não cabe no JSON.
+    """
+    if 'valor' not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    col = df['valor']
+    present = col.notna()
+    valor = pd.to_numeric(col, errors='coerce').astype(float)
+    
+    # O que o pandas não converteu é reavaliado com float() para manter a mensagem de erro
+    for idx in col.index[present & valor.isna()]:
+        try:
+            valor[idx] = float(col[idx])
+        except Exception as e:
+            errors.setdefault(idx, str(e))
+    valor = valor.where(present, 0.0)
+    finite = valor.abs() < float('inf')
+    if not finite.all():
+        valor = valor.astype(object).where(finite, None)
+    return valor
+
+def _date_column(df, column, errors, rows=None):
+    """
+    Datas (date) de uma coluna, como pd.to_datetime(valor).date() por célula
+    
+    `rows` limita a conversão (e os erros) às linhas marcadas.
+    """
+    result = _none_series(df)
+    if column not in df.columns:
+        return result
+    col = df[column]
+    present = col.notna()
+    if rows is not None:
+        present &= rows
+    if not present.any():
+        return result
+    
+    try:
+        parsed = pd.to_datetime(col.where(present), errors='coerce', format='mixed')
+        converted = present & parsed.notna()
+        result[converted] = parsed[converted].dt.date
+        pending = col.index[present & ~converted]
+    except (TypeError, ValueError):
+        pending = col.index[present]
+    
+    for idx in pending:
+        try:
+            result[idx] = pd.to_datetime(col[idx]).date()
+        except Exception as e:
+            errors.setdefault(idx, str(e))
+    return result
+
+def _status_column(df):
+    """Mapear status textual para StatusEnum (padrão: disponível)"""
+    result = pd.Series(StatusEnum.disponivel, index=df.index, dtype=object)
+    if 'status' not in df.columns:
+        return result
+    col = df['status']
+    mapped = _as_text(col).str.strip().str.lower().map(STATUS_MAP)
+    mapped = mapped.where(col.notna() & mapped.notna(), StatusEnum.disponivel)
+    return mapped.astype(object)
+
+def record_fingerprint(values):
+    """Impressão digital (SHA-1) dos valores normalizados de um registro"""
+    return hashlib.sha1(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+def _split_records(out, keep, errors):
+    """Converter as linhas mantidas em registros e listar os erros por linha"""
+    if errors:
+        keep = keep & ~out.index.isin(list(errors))
+    out = out[keep]
+    records = out.to_dict('records')
+    for idx, record in zip(out.index, records):
+        # Conteúdo normalizado, para a importação delta
+        record['fingerprint'] = record_fingerprint(list(record.values()))
+        # Número da linha de origem, para o relatório de erros
+        record['row'] = idx
+    return records, sorted(errors.items())
+
+def user_records(df):
+    """
+    Extrair registros de usuários de um DataFrame (normalização vetorizada)
+    Retorna (registros, erros), com erros como lista de (linha, mensagem)
+    """
+    nome = _as_text(df['nome']).str.strip() if 'nome' in df.columns else pd.Series('', index=df.index)
+    out = pd.DataFrame({
+        'cpf': normalize_cpf_column(df['cpf']) if 'cpf' in df.columns else _none_series(df),
+        'nome': nome,
+        'cargo': _text_column(df, 'cargo'),
+        'cidade': _text_column(df, 'cidade'),
+        'setor': _text_column(df, 'setor'),
+        'email': _text_column(df, 'email'),
+        'matricula': _text_column(df, 'matricula')
+    }, index=df.index)
+    
+    return _split_records(out, nome != '', {})
+
+def equipment_records(df, parse_details=True):
+    """
+    Extrair registros de equipamentos de um DataFrame (normalização vetorizada)
+    Retorna (registros, erros), com erros como lista de (linha, mensagem)
+    
+    Sem `parse_details` (importação por CSV), data de aquisição e status
+    são ignorados e toda instância entra como disponível.
+    """
+    errors = {}
+    nome = _text_column(df, 'nome')
+    named = nome.notna() & (nome != '')
+    # Mesma ordem do tratamento por linha: o valor é convertido (e pode dar
+    # erro) antes de testar o nome; a data, só nas linhas com nome
+    valor = _valor_column(df, errors)
+    out = pd.DataFrame({
+        'nome': nome,
+        'marca': _text_column(df, 'marca'),
+        'modelo': _text_column(df, 'modelo'),
+        'patrimonial': _text_column(df, 'patrimonial'),
+        'serial': _text_column(df, 'serial'),
+        'nota_data': _date_column(df, 'data_aquisicao', errors, named) if parse_details else _none_series(df),
+        'valor': valor,
+        'status': _status_column(df) if parse_details else pd.Series(StatusEnum.disponivel, index=df.index, dtype=object)
+    }, index=df.index)
+    
+    return _split_records(out, named, errors)
+
+_normalize_pool = None
+_normalize_pool_size = 0
+_normalize_pool_lock = threading.Lock()
+
+# Gravações das importações, uma por vez no processo (ver ImportService._writing)
+_write_lock = threading.Lock()
+_write_generation = 0
+
+def normalize_pool(workers):
+    """
+    Pool de processos da normalização paralela, com pelo menos `workers` processos
+    
+    Criado na primeira importação que o usa e mantido enquanto o processo
+    viver, em vez de um pool novo (e processos novos) a cada importação. Com
+    forkserver, os processos saem de um servidor que já importou pandas,
+    openpyxl e SQLAlchemy. Este módulo não entra no preload: no Python 3.11 o
+    servidor ignora o sys.path do processo pai e poderia achar outro
+    import_service; cada processo o importa com o sys.path certo. Um pedido
+    maior troca o pool; o anterior termina o que já recebeu.
+    """
+    global _normalize_pool, _normalize_pool_size
+    with _normalize_pool_lock:
+        if _normalize_pool is None or _normalize_pool_size < workers:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['pandas', 'openpyxl', 'sqlalchemy'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            if _normalize_pool is not None:
+                _normalize_pool.shutdown(wait=False)
+            _normalize_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _normalize_pool_size = workers
+            # Encerrar o pool na saída antes de o multiprocessing esperar pelos
+            # processos filhos (senão um processo filho, como os do benchmark,
+            # esperaria para sempre pelos workers ociosos) e antes de fechar as
+            # filas do próprio pool (prioridade 10)
+            multiprocessing.util.Finalize(None, _normalize_pool.shutdown, exitpriority=20)
+        return _normalize_pool
+
 class ImportService:
     """Serviço de importação de dados"""
     
-    def __init__(self, session):
+    def __init__(self, session, batch_size=None, progress=None, error_report=None):
         self.session = session
-        
+        self.batch_size = batch_size or Config.IMPORT_BATCH_SIZE
+        # Callback opcional progress(linhas, stats), chamado a cada bloco gravado
+        self.progress = progress
+        # Caminho opcional do CSV com as linhas rejeitadas
+        self.error_report = error_report
+        self._pending_errors = []
+        self._reset_caches()
+    
     def normalize_cpf(self, cpf):
         """Normalizar CPF"""
-        if pd.isna(cpf) or not cpf:
-            return None
-        cpf_str = str(cpf).strip()
-        # Remover caracteres não numéricos
-        cpf_clean = ''.join(filter(str.isdigit, cpf_str))
-        if len(cpf_clean) == 11:
-            return f"{cpf_clean[:3]}.{cpf_clean[3:6]}.{cpf_clean[6:9]}-{cpf_clean[9:]}"
-        return cpf_clean if cpf_clean else None
+        return normalize_cpf(cpf)
     
-    def import_users_from_csv(self, file_path):
+    # ============== USUÁRIOS ==============
+    
+    def import_users_from_csv(self, file_path, chunk_size=None, workers=None, delta=False):
         """
         Importar usuários do CSV
         Esperado: colunas como nome, cpf, cargo, cidade, setor, matricula, email
+        
+        Com `chunk_size`, o arquivo é lido em blocos, cada bloco é gravado em
+        sua própria transação e um checkpoint permite retomar a importação.
+        Com `workers`, os blocos são normalizados em paralelo (ver _normalized_chunks).
+        Com `delta`, usuários idênticos à última importação não são regravados.
         """
-        try:
-            df = pd.read_csv(file_path, encoding='utf-8')
-        except UnicodeDecodeError:
-            df = pd.read_csv(file_path, encoding='latin-1')
+        stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
         
-        # Normalizar nomes de colunas (minúsculas, sem espaços)
-        df.columns = df.columns.str.lower().str.strip().str.replace(' ', '_')
+        def write(records):
+            self.upsert_users(records, stats, delta=delta)
         
-        stats = {'created': 0, 'updated': 0, 'errors': 0}
+        if chunk_size or workers:
+            chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+            return self._import_in_chunks(
+                'users', file_path,
+                lambda start: self._iter_csv_chunks(file_path, chunk_size, start),
+                user_records, write, stats, workers
+            )
         
-        for idx, row in df.iterrows():
-            try:
-                # Extrair dados
-                cpf = self.normalize_cpf(row.get('cpf'))
-                nome = str(row.get('nome', '')).strip()
-                cargo = str(row.get('cargo', '')).strip() if pd.notna(row.get('cargo')) else None
-                cidade = str(row.get('cidade', '')).strip() if pd.notna(row.get('cidade')) else None
-                setor = str(row.get('setor', '')).strip() if pd.notna(row.get('setor')) else None
-                email = str(row.get('email', '')).strip() if pd.notna(row.get('email')) else None
-                matricula = str(row.get('matricula', '')).strip() if pd.notna(row.get('matricula')) else None
-                
-                if not nome:
+        df = self._normalize_columns(self._read_csv(file_path))
+        normalized = user_records(df)
+        with self._writing():
+            self._apply(normalized, write, stats)
+            self.session.commit()
+        self._flush_errors()
+        self._report_progress(len(df), stats)
+        return stats
+    
+    def import_users_from_parquet(self, file_path, chunk_size=None, workers=None, delta=False):
+        """
+        Importar usuários de Parquet ou Arrow IPC (.arrow/.feather)
+        
+        As colunas já chegam tipadas: não há parsing de texto nem inferência
+        de tipos, só a normalização e a gravação em lote.
+        """
+        stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        
+        def write(records):
+            self.upsert_users(records, stats, delta=delta)
+        
+        if chunk_size or workers:
+            chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+            return self._import_in_chunks(
+                'users_parquet', file_path,
+                lambda start: self._iter_table_chunks(file_path, chunk_size, start),
+                user_records, write, stats, workers
+            )
+        
+        df = self._read_table(file_path)
+        normalized = user_records(df)
+        with self._writing():
+            self._apply(normalized, write, stats)
+            self.session.commit()
+        self._flush_errors()
+        self._report_progress(len(df), stats)
+        return stats
+    
+    def upsert_users(self, records, stats, delta=False):
+        """
+        Gravar usuários em lote (INSERT/UPDATE em massa)
+        
+        Carrega as chaves existentes (cpf/matrícula) uma única vez, separa os
+        registros em inserções e atualizações em memória e grava tudo em
+        poucos comandos de até `batch_size` linhas.
+        
+        A impressão digital de cada usuário gravado é guardada; com `delta`,
+        linhas cuja impressão digital não mudou são contadas em `unchanged`
+        e não geram UPDATE.
+        """
+        by_cpf, by_matricula, keys = self._load_user_keys()
+        stored = self._load_fingerprints('users')
+        fingerprints = {}
+        
+        inserts = []
+        insert_fingerprints = []
+        updates = {}
+        pending_by_cpf = {}
+        pending_by_matricula = {}
+        now = datetime.now()
+        
+        for record in records:
+            cpf = record['cpf']
+            matricula = record['matricula']
+            fields = {k: record[k] for k in ('nome', 'cargo', 'cidade', 'setor', 'email')}
+            # INSERT/UPDATE em massa não passam pelos eventos do ORM
+            fields.update(folded_user_fields(fields))
+            
+            # Buscar por CPF e, só sem CPF correspondente, por matrícula. Cada chave
+            # é procurada entre os usuários já gravados e entre as inserções
+            # pendentes (linhas anteriores do próprio arquivo), como as consultas
+            # com autoflush do importador linha a linha. Inserções pendentes são
+            # identificadas por ids negativos.
+            target = None
+            if cpf:
+                target = by_cpf.get(cpf, pending_by_cpf.get(cpf))
+            if target is None and matricula:
+                target = by_matricula.get(matricula, pending_by_matricula.get(matricula))
+            
+            if target is None:
+                pending_id = -1 - len(inserts)
+                inserts.append(dict(fields, cpf=cpf, matricula=matricula))
+                insert_fingerprints.append(record['fingerprint'])
+                if cpf:
+                    pending_by_cpf[cpf] = pending_id
+                if matricula:
+                    pending_by_matricula[matricula] = pending_id
+                stats['created'] += 1
+                continue
+            
+            if target > 0:
+                if delta and fingerprints.get(target, stored.get(str(target))) == record['fingerprint']:
+                    stats['unchanged'] += 1
                     continue
-                
-                # Buscar por CPF ou matrícula
-                user = None
+                current = keys[target]
+                current_cpf, current_matricula = current
+            else:
+                current = inserts[-1 - target]
+                current_cpf, current_matricula = current['cpf'], current['matricula']
+            fill_cpf = bool(cpf) and not current_cpf
+            fill_matricula = bool(matricula) and not current_matricula
+            
+            # A chave a preencher já pertence a outro usuário: o UPDATE violaria a
+            # restrição de unicidade no commit, então a linha é rejeitada aqui
+            if fill_cpf and by_cpf.get(cpf, pending_by_cpf.get(cpf)) not in (None, target):
+                self._record_error(stats, record['row'], 'CPF já pertence a outro usuário', 'cpf', cpf)
+                continue
+            if fill_matricula and by_matricula.get(matricula, pending_by_matricula.get(matricula)) not in (None, target):
+                self._record_error(stats, record['row'], 'Matrícula já pertence a outro usuário',
+                                   'matricula', matricula)
+                continue
+            
+            if target > 0:
+                row = updates.setdefault(target, {'id': target})
+                row.update(fields)
+                row['updated_at'] = now
+                fingerprints[target] = record['fingerprint']
+                if fill_cpf:
+                    row['cpf'] = current[0] = cpf
+                    by_cpf[cpf] = target
+                if fill_matricula:
+                    row['matricula'] = current[1] = matricula
+                    by_matricula[matricula] = target
+            else:
+                current.update(fields)
+                insert_fingerprints[-1 - target] = record['fingerprint']
+                if fill_cpf:
+                    current['cpf'] = cpf
+                    pending_by_cpf[cpf] = target
+                if fill_matricula:
+                    current['matricula'] = matricula
+                    pending_by_matricula[matricula] = target
+            stats['updated'] += 1
+        
+        for start, batch in zip(range(0, len(inserts), self.batch_size), self._batches(inserts)):
+            ids = self._insert_returning_ids(User, batch)
+            fingerprints.update(zip(ids, insert_fingerprints[start:start + len(batch)]))
+            # Registrar as novas chaves para os próximos blocos
+            for row, user_id in zip(batch, ids):
+                if row['cpf']:
+                    by_cpf[row['cpf']] = user_id
+                if row['matricula']:
+                    by_matricula[row['matricula']] = user_id
+                keys[user_id] = [row['cpf'], row['matricula']]
+        for batch in self._batches(list(updates.values())):
+            self.session.execute(update(User), batch)
+        self._save_fingerprints('users', {str(k): v for k, v in fingerprints.items()})
+    
+    def _load_user_keys(self):
+        """Mapas cpf -> id, matrícula -> id e id -> [cpf, matrícula] (cacheados)"""
+        if self._user_keys is None:
+            by_cpf = {}
+            by_matricula = {}
+            keys = {}
+            for user_id, cpf, matricula in self.session.query(User.id, User.cpf, User.matricula):
                 if cpf:
-                    user = self.session.query(User).filter_by(cpf=cpf).first()
-                if not user and matricula:
-                    user = self.session.query(User).filter_by(matricula=matricula).first()
-                
-                if user:
-                    # Atualizar
-                    user.nome = nome
-                    user.cargo = cargo
-                    user.cidade = cidade
-                    user.setor = setor
-                    user.email = email
-                    if cpf and not user.cpf:
-                        user.cpf = cpf
-                    if matricula and not user.matricula:
-                        user.matricula = matricula
-                    user.updated_at = datetime.now()
-                    stats['updated'] += 1
-                else:
-                    # Criar novo
-                    user = User(
-                        cpf=cpf,
-                        nome=nome,
-                        cargo=cargo,
-                        cidade=cidade,
-                        setor=setor,
-                        email=email,
-                        matricula=matricula
-                    )
-                    self.session.add(user)
-                    stats['created'] += 1
-                
-            except Exception as e:
-                stats['errors'] += 1
-                print(f"Erro na linha {idx}: {e}")
+                    by_cpf[cpf] = user_id
+                if matricula:
+                    by_matricula[matricula] = user_id
+                keys[user_id] = [cpf, matricula]
+            self._user_keys = (by_cpf, by_matricula, keys)
+        return self._user_keys
+    
+    def _insert_returning_ids(self, model, rows):
+        """
+        INSERT em massa devolvendo o id gerado para cada linha, na ordem de `rows`
         
-        self.session.commit()
-        return stats
+        RETURNING com sort_by_parameter_order vira um INSERT por linha no
+        SQLite; aqui o RETURNING traz também os valores gravados e cada id é
+        casado com sua linha por eles (linhas com os mesmos valores são
+        intercambiáveis).
+        """
+        columns = list(rows[0])
+        returned = self.session.execute(
+            insert(model).returning(model.id, *(getattr(model, c) for c in columns)),
+            rows,
+            # NULLs explícitos: sem isso, linhas com valores vazios em colunas
+            # diferentes são separadas em vários INSERTs
+            execution_options={'render_nulls': True}
+        ).all()
+        
+        ids = defaultdict(list)
+        for row in returned:
+            ids[tuple(row[1:])].append(row[0])
+        result = []
+        for r in rows:
+            matches = ids[tuple(r[c] for c in columns)]
+            if not matches:
+                # O banco gravou algo diferente do enviado (conversão de tipo)
+                raise Exception(f"INSERT em {model.__tablename__}: nenhuma linha devolvida "
+                                f"corresponde aos valores enviados {dict(r)!r}")
+            result.append(matches.pop())
+        return result
+    
+    def _batches(self, rows):
+        """Dividir uma lista de registros em lotes de `batch_size`"""
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start:start + self.batch_size]
+    
+    # ============== EQUIPAMENTOS ==============
     
-    def import_equipment_from_excel(self, file_path):
+    def import_equipment_from_excel(self, file_path, chunk_size=None, workers=None, delta=False):
         """
         Importar equipamentos do Excel
         Esperado: colunas como nome, marca, modelo, patrimonial, serial, data_aquisicao, status
         """
+        stats = {'equipment_types_created': 0, 'instances_created': 0, 'instances_updated': 0, 'unchanged': 0,
+                 'errors': 0}
+        normalize = partial(equipment_records, parse_details=True)
+        
+        def write(records):
+            self.insert_equipment(records, stats, origem='import_excel',
+                                  especificacoes=json.dumps({'imported': True}), delta=delta)
+        
+        if chunk_size or workers:
+            chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+            return self._import_in_chunks(
+                'equipment_excel', file_path,
+                lambda start: self._iter_excel_chunks(file_path, chunk_size, start),
+                normalize, write, stats, workers
+            )
+        
         try:
-            df = pd.read_excel(file_path, engine='openpyxl')
+            df = pd.read_excel(self._rewind(file_path), engine='openpyxl')
         except Exception as e:
             # Fallback: tentar ler como CSV
             try:
-                df = pd.read_csv(file_path)
+                df = pd.read_csv(self._rewind(file_path))
             except:
                 raise Exception(f"Não foi possível ler o arquivo: {e}")
         
-        # Normalizar nomes de colunas
-        df.columns = df.columns.str.lower().str.strip().str.replace(' ', '_')
+        normalized = normalize(self._normalize_columns(df))
+        with self._writing():
+            self._apply(normalized, write, stats)
+            self.session.commit()
+        self._flush_errors()
+        self._report_progress(len(df), stats)
+        return stats
+    
+    def import_equipment_from_csv(self, file_path, chunk_size=None, workers=None, delta=False):
+        """Importar equipamentos de CSV (alternativa ao Excel)"""
+        stats = {'equipment_types_created': 0, 'instances_created': 0, 'instances_updated': 0, 'unchanged': 0,
+                 'errors': 0}
+        normalize = partial(equipment_records, parse_details=False)
+        
+        def write(records):
+            self.insert_equipment(records, stats, origem='import_csv', delta=delta, details=False)
         
-        stats = {'equipment_types_created': 0, 'instances_created': 0, 'errors': 0}
+        if chunk_size or workers:
+            chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+            return self._import_in_chunks(
+                'equipment_csv', file_path,
+                lambda start: self._iter_csv_chunks(file_path, chunk_size, start),
+                normalize, write, stats, workers
+            )
         
-        for idx, row in df.iterrows():
-            try:
-                # Extrair dados
-                nome = str(row.get('nome', '')).strip() if pd.notna(row.get('nome')) else None
-                marca = str(row.get('marca', '')).strip() if pd.notna(row.get('marca')) else None
-                modelo = str(row.get('modelo', '')).strip() if pd.notna(row.get('modelo')) else None
-                patrimonial = str(row.get('patrimonial', '')).strip() if pd.notna(row.get('patrimonial')) else None
-                serial = str(row.get('serial', '')).strip() if pd.notna(row.get('serial')) else None
-                data_aquisicao = row.get('data_aquisicao')
-                status_str = str(row.get('status', 'disponível')).strip().lower() if pd.notna(row.get('status')) else 'disponível'
-                valor = float(row.get('valor', 0)) if pd.notna(row.get('valor')) else 0.0
-                
-                if not nome:
-                    continue
-                
-                # Buscar ou criar tipo de equipamento
-                eq_type = self.session.query(EquipmentType).filter_by(
-                    nome=nome, 
-                    marca=marca, 
-                    modelo=modelo
-                ).first()
+        df = self._normalize_columns(self._read_csv(file_path))
+        normalized = normalize(df)
+        with self._writing():
+            self._apply(normalized, write, stats)
+            self.session.commit()
+        self._flush_errors()
+        self._report_progress(len(df), stats)
+        return stats
+    
+    def import_equipment_from_parquet(self, file_path, chunk_size=None, workers=None, delta=False):
+        """Importar equipamentos de Parquet ou Arrow IPC (colunas já tipadas)"""
+        stats = {'equipment_types_created': 0, 'instances_created': 0, 'instances_updated': 0, 'unchanged': 0,
+                 'errors': 0}
+        normalize = partial(equipment_records, parse_details=True)
+        
+        def write(records):
+            self.insert_equipment(records, stats, origem='import_parquet', delta=delta)
+        
+        if chunk_size or workers:
+            chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+            return self._import_in_chunks(
+                'equipment_parquet', file_path,
+                lambda start: self._iter_table_chunks(file_path, chunk_size, start),
+                normalize, write, stats, workers
+            )
+        
+        df = self._read_table(file_path)
+        normalized = normalize(df)
+        with self._writing():
+            self._apply(normalized, write, stats)
+            self.session.commit()
+        self._flush_errors()
+        self._report_progress(len(df), stats)
+        return stats
+    
+    def insert_equipment(self, records, stats, origem, especificacoes=None, delta=False, details=True):
+        """
+        Gravar equipamentos em lote
+        
+        Resolve todos os tipos (nome, marca, modelo) contra um mapa carregado
+        uma única vez, cria os tipos novos de uma vez e grava itens de estoque
+        e instâncias com INSERTs em massa, sem flush por linha.
+        
+        Com `delta`, patrimoniais de uma importação anterior cujo conteúdo
+        mudou são atualizados (_update_equipment). Sem `details` (CSV), a data
+        de aquisição e o status do arquivo não valem para essas atualizações.
+        """
+        records, changed = self._validate_equipment(records, stats, delta)
+        type_ids = self._load_equipment_types()
+        
+        # Criar tipos novos (distintos) em uma única passada
+        new_types = []
+        for record in records + changed:
+            key = (record['nome'], record['marca'], record['modelo'])
+            if key not in type_ids:
+                type_ids[key] = None
+                new_types.append({
+                    'nome': key[0],
+                    'marca': key[1],
+                    'modelo': key[2],
+                    'especificacoes': especificacoes
+                })
+        
+        for batch in self._batches(new_types):
+            ids = self._insert_returning_ids(EquipmentType, batch)
+            for row, type_id in zip(batch, ids):
+                type_ids[(row['nome'], row['marca'], row['modelo'])] = type_id
+        stats['equipment_types_created'] += len(new_types)
+        
+        # Cada linha gera um item de estoque e uma instância
+        counters = CounterChanges()
+        for batch in self._batches(records):
+            stock_ids = self._insert_returning_ids(StockItem, [{
+                    'equipment_type_id': type_ids[(r['nome'], r['marca'], r['modelo'])],
+                    'nota_numero': None,
+                    'nota_data': r['nota_data'],
+                    'quantidade': 1,
+                    'valor_unitario': r['valor'],
+                    'valor_total': r['valor'],
+                    'origem': origem
+                } for r in batch])
+            
+            self.session.execute(insert(EquipmentInstance), [{
+                'stock_item_id': stock_id,
+                'patrimonial': r['patrimonial'],
+                'serial': r['serial'],
+                'status': r['status']
+            } for r, stock_id in zip(batch, stock_ids)], execution_options={'render_nulls': True})
+            stats['instances_created'] += len(batch)
+            
+            for r in batch:
+                type_id = type_ids[(r['nome'], r['marca'], r['modelo'])]
+                counters.add_instances(type_id, r['status'] or StatusEnum.disponivel)
+                counters.add_value(type_id, r['valor'])
+        
+        if changed:
+            self._update_equipment(changed, type_ids, counters, stats, details)
+        
+        # Contadores do estoque na mesma transação dos equipamentos
+        counters.apply(self.session)
+        self._load_patrimoniais().update(r['patrimonial'] for r in records if r['patrimonial'] is not None)
+        self._save_fingerprints('equipment', {
+            r['patrimonial']: r['fingerprint'] for r in records + changed if r['patrimonial'] is not None
+        })
+    
+    def _update_equipment(self, records, type_ids, counters, stats, details=True):
+        """
+        Atualizar instâncias já importadas cujo conteúdo mudou (importação delta)
+        
+        Tipo, valor e serial passam a ser os do arquivo; com `details`, também
+        a data de aquisição e o status, este só em instâncias que não estão
+        com um usuário (a destinação feita no sistema prevalece). Os
+        contadores do estoque acompanham as mudanças de tipo, status e valor.
+        """
+        by_patrimonial = {r['patrimonial']: r for r in records}
+        stock_rows = []
+        instance_rows = []
+        for batch in self._batches(list(by_patrimonial)):
+            current = self.session.query(
+                EquipmentInstance.id, EquipmentInstance.patrimonial, EquipmentInstance.status,
+                EquipmentInstance.current_user_id, StockItem.id, StockItem.equipment_type_id, StockItem.valor_total
+            ).join(StockItem, EquipmentInstance.stock_item_id == StockItem.id).filter(
+                EquipmentInstance.patrimonial.in_(batch)
+            )
+            for instance_id, patrimonial, status, user_id, stock_id, type_id, valor in current:
+                r = by_patrimonial[patrimonial]
+                new_type_id = type_ids[(r['nome'], r['marca'], r['modelo'])]
+                status = status or StatusEnum.disponivel
+                new_status = (r['status'] or StatusEnum.disponivel) if details and user_id is None else status
                 
-                if not eq_type:
-                    eq_type = EquipmentType(
-                        nome=nome,
-                        marca=marca,
-                        modelo=modelo,
-                        especificacoes=json.dumps({'imported': True})
-                    )
-                    self.session.add(eq_type)
-                    self.session.flush()
-                    stats['equipment_types_created'] += 1
+                counters.add_instances(type_id, status, -1)
+                counters.add_value(type_id, -(valor or 0.0))
+                counters.add_instances(new_type_id, new_status)
+                counters.add_value(new_type_id, r['valor'])
                 
-                # Criar item de estoque
-                stock_item = StockItem(
-                    equipment_type_id=eq_type.id,
-                    nota_numero=None,
-                    nota_data=pd.to_datetime(data_aquisicao).date() if pd.notna(data_aquisicao) else None,
-                    quantidade=1,
-                    valor_unitario=valor,
-                    valor_total=valor,
-                    origem='import_excel'
+                stock = {'id': stock_id, 'equipment_type_id': new_type_id,
+                         'valor_unitario': r['valor'], 'valor_total': r['valor']}
+                if details:
+                    stock['nota_data'] = r['nota_data']
+                stock_rows.append(stock)
+                instance_rows.append({'id': instance_id, 'serial': r['serial'], 'status': new_status})
+        
+        for batch in self._batches(stock_rows):
+            self.session.execute(update(StockItem), batch)
+        for batch in self._batches(instance_rows):
+            self.session.execute(update(EquipmentInstance), batch)
+        stats['instances_updated'] += len(instance_rows)
+    
+    def _validate_equipment(self, records, stats, delta=False):
+        """
+        Rejeitar, antes de gravar, linhas cujo patrimonial já está cadastrado
+        ou se repete no próprio arquivo (mantém a primeira ocorrência)
+        
+        Com `delta`, um patrimonial gravado por uma importação anterior é
+        apenas contado em `unchanged` se o conteúdo for o mesmo, ou separado
+        para atualização se mudou. Retorna (registros a inserir, registros a
+        atualizar).
+        """
+        if not records:
+            return records, []
+        
+        patrimonial = pd.Series([r['patrimonial'] for r in records], dtype=object)
+        present = patrimonial.notna()
+        in_db = present & patrimonial.isin(self._load_patrimoniais())
+        in_file = present & ~in_db & patrimonial.duplicated()
+        
+        unchanged = pd.Series(False, index=patrimonial.index)
+        changed = pd.Series(False, index=patrimonial.index)
+        if delta and in_db.any():
+            stored = patrimonial.map(self._load_fingerprints('equipment'))
+            fingerprint = pd.Series([r['fingerprint'] for r in records], dtype=object)
+            imported = in_db & stored.notna() & ~patrimonial.duplicated()
+            unchanged = imported & (stored == fingerprint)
+            changed = imported & ~unchanged
+            in_db &= ~imported
+            stats['unchanged'] += int(unchanged.sum())
+        
+        rejected = (in_db | in_file | unchanged | changed).to_numpy()
+        if not rejected.any():
+            return records, []
+        
+        for i in (in_db | in_file).to_numpy().nonzero()[0]:
+            message = 'Patrimonial já cadastrado' if in_db.iat[i] else 'Patrimonial duplicado no arquivo'
+            self._record_error(stats, records[i]['row'], message, 'patrimonial', records[i]['patrimonial'])
+        return ([r for r, bad in zip(records, rejected) if not bad],
+                [r for r, update in zip(records, changed.to_numpy()) if update])
+    
+    def _load_patrimoniais(self):
+        """Conjunto de patrimoniais já cadastrados (cacheado)"""
+        if self._patrimoniais is None:
+            self._patrimoniais = {
+                patrimonial for (patrimonial,) in self.session.query(EquipmentInstance.patrimonial).filter(
+                    EquipmentInstance.patrimonial.isnot(None)
                 )
-                self.session.add(stock_item)
-                self.session.flush()
-                
-                # Mapear status
-                status_map = {
-                    'disponível': StatusEnum.disponivel,
-                    'disponivel': StatusEnum.disponivel,
-                    'alocado': StatusEnum.alocado,
-                    'em manutenção': StatusEnum.em_manutencao,
-                    'em manutencao': StatusEnum.em_manutencao,
-                    'baixado': StatusEnum.baixado
-                }
-                status = status_map.get(status_str, StatusEnum.disponivel)
-                
-                # Criar instância de equipamento
-                instance = EquipmentInstance(
-                    stock_item_id=stock_item.id,
-                    patrimonial=patrimonial,
-                    serial=serial,
-                    status=status
+            }
+        return self._patrimoniais
+    
+    def _load_equipment_types(self):
+        """Mapa (nome, marca, modelo) -> id dos tipos já cadastrados (cacheado)"""
+        if self._type_ids is None:
+            self._type_ids = {
+                (nome, marca, modelo): type_id
+                for type_id, nome, marca, modelo in self.session.query(
+                    EquipmentType.id, EquipmentType.nome, EquipmentType.marca, EquipmentType.modelo
                 )
-                self.session.add(instance)
-                stats['instances_created'] += 1
-                
-            except Exception as e:
-                stats['errors'] += 1
-                print(f"Erro na linha {idx}: {e}")
+            }
+        return self._type_ids
+    
+    def _load_fingerprints(self, kind):
+        """Mapa chave -> impressão digital da última importação (cacheado)"""
+        if kind not in self._fingerprints:
+            self._fingerprints[kind] = dict(
+                self.session.query(ImportFingerprint.record_key, ImportFingerprint.fingerprint).filter_by(kind=kind)
+            )
+        return self._fingerprints[kind]
+    
+    def _save_fingerprints(self, kind, fingerprints):
+        """Gravar impressões digitais novas ou alteradas, em lote"""
+        stored = self._load_fingerprints(kind)
+        rows = [{'kind': kind, 'record_key': key, 'fingerprint': value}
+                for key, value in fingerprints.items() if stored.get(key) != value]
+        inserts = [row for row in rows if row['record_key'] not in stored]
+        updates = [row for row in rows if row['record_key'] in stored]
         
-        self.session.commit()
-        return stats
+        for batch in self._batches(inserts):
+            self.session.execute(insert(ImportFingerprint), batch)
+        for batch in self._batches(updates):
+            self.session.execute(update(ImportFingerprint), batch)
+        stored.update(fingerprints)
     
-    def import_equipment_from_csv(self, file_path):
-        """Importar equipamentos de CSV (alternativa ao Excel)"""
-        # Mesma lógica, mas lê CSV
+    def _reset_caches(self):
+        """Descartar mapas de chaves em memória (ex.: após rollback)"""
+        self._user_keys = None
+        self._type_ids = None
+        self._patrimoniais = None
+        self._fingerprints = {}
+        self._caches_generation = _write_generation
+    
+    @contextmanager
+    def _writing(self):
+        """
+        Transação de gravação exclusiva entre as importações do processo
+        
+        Importações simultâneas (workers da fila, rotas síncronas) gravariam
+        com mapas de chaves carregados antes dos commits umas das outras e
+        criariam tipos duplicados ou violariam o patrimonial único. Cada
+        gravação espera a anterior e, se outra importação gravou desde a
+        carga dos mapas, recarrega-os dentro da própria transação.
+        """
+        global _write_generation
+        with _write_lock:
+            if self._caches_generation != _write_generation:
+                self._reset_caches()
+            try:
+                yield
+            finally:
+                _write_generation += 1
+                self._caches_generation = _write_generation
+    
+    def _apply(self, normalized, write, stats):
+        """Registrar erros de normalização e gravar os registros válidos"""
+        records, errors = normalized
+        for idx, message in errors:
+            self._record_error(stats, idx, message)
+        write(records)
+    
+    def _record_error(self, stats, row, message, field=None, value=None, quiet=False):
+        """Contabilizar uma linha rejeitada e anotá-la no relatório de erros"""
+        stats['errors'] += 1
+        if not quiet:
+            print(f"Erro na linha {row}: {message}")
+        if self.error_report:
+            # Linha como no editor de planilhas: cabeçalho é a linha 1
+            self._pending_errors.append([int(row) + 2, field or '', '' if value is None else value, message])
+    
+    def _flush_errors(self):
+        """Acrescentar ao CSV de erros as linhas rejeitadas desde a última gravação"""
+        if not self.error_report or not self._pending_errors:
+            return
+        new_file = not os.path.exists(self.error_report)
+        with open(self.error_report, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(['linha', 'campo', 'valor', 'erro'])
+            writer.writerows(self._pending_errors)
+        self._pending_errors = []
+    
+    def _report_progress(self, rows, stats):
+        if self.progress:
+            self.progress(rows, stats)
+    
+    # ============== LEITURA DE ARQUIVOS ==============
+    
+    def count_rows(self, file_path):
+        """Estimar o número de linhas de dados do arquivo (para progresso/ETA)"""
+        if self._extension(file_path) == 'parquet':
+            return self._parquet_file(file_path).metadata.num_rows
+        if self._extension(file_path) in TABLE_EXTENSIONS:
+            return self._arrow_table(file_path).num_rows
+        
+        if self._extension(file_path) in ('xlsx', 'xls'):
+            try:
+                workbook = load_workbook(self._rewind(file_path), read_only=True)
+                try:
+                    max_row = workbook.active.max_row
+                finally:
+                    workbook.close()
+                return max(max_row - 1, 0) if max_row else None
+            except Exception:
+                pass
+        
+        lines = 0
+        last = b''
+        with self._open_binary(file_path) as f:
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                lines += block.count(b'\n')
+                last = block
+        if last and not last.endswith(b'\n'):
+            lines += 1
+        return max(lines - 1, 0)
+    
+    # Os leitores aceitam um caminho ou um arquivo já aberto em modo binário
+    # (upload mantido em memória, ver utils.SpooledUpload)
+    
+    def _extension(self, file_path):
+        if isinstance(file_path, (str, os.PathLike)):
+            return os.fspath(file_path).rsplit('.', 1)[-1].lower()
+        return getattr(file_path, 'extension', '')
+    
+    def _rewind(self, file_path):
+        """Voltar ao início um arquivo aberto, para ser lido de novo"""
+        if hasattr(file_path, 'seek'):
+            file_path.seek(0)
+        return file_path
+    
+    @contextmanager
+    def _open_binary(self, file_path):
+        if hasattr(file_path, 'read'):
+            yield self._rewind(file_path)
+            file_path.seek(0)
+        else:
+            with open(file_path, 'rb') as f:
+                yield f
+    
+    def _normalize_columns(self, df):
+        """Normalizar nomes de colunas (minúsculas, sem espaços)"""
+        df.columns = df.columns.astype(str).str.lower().str.strip().str.replace(' ', '_')
+        return df
+    
+    def _read_csv(self, file_path):
+        """Ler CSV em UTF-8, com fallback para latin-1"""
         try:
-            df = pd.read_csv(file_path, encoding='utf-8')
+            return pd.read_csv(self._rewind(file_path), encoding='utf-8')
         except UnicodeDecodeError:
-            df = pd.read_csv(file_path, encoding='latin-1')
+            return pd.read_csv(self._rewind(file_path), encoding='latin-1')
+    
+    def _detect_encoding(self, file_path):
+        """Detectar a codificação do CSV sem carregar o arquivo inteiro"""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            with self._open_binary(file_path) as f:
+                while True:
+                    block = f.read(1024 * 1024)
+                    if not block:
+                        break
+                    decoder.decode(block)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return 'latin-1'
+        return 'utf-8'
+    
+    def _iter_csv_chunks(self, file_path, chunk_size, start=0):
+        """Ler CSV em blocos de `chunk_size` linhas, a partir da linha `start`"""
+        encoding = self._detect_encoding(file_path)
+        reader = pd.read_csv(
+            self._rewind(file_path),
+            encoding=encoding,
+            chunksize=chunk_size,
+            skiprows=range(1, start + 1) if start else None
+        )
+        offset = start
+        for df in reader:
+            df.index = range(offset, offset + len(df))
+            offset += len(df)
+            yield self._normalize_columns(df)
+    
+    def _iter_excel_chunks(self, file_path, chunk_size, start=0):
+        """Ler XLSX em modo read-only, linha a linha, em blocos de `chunk_size`"""
+        try:
+            workbook = load_workbook(self._rewind(file_path), read_only=True, data_only=True)
+        except Exception:
+            # Fallback: tentar ler como CSV
+            yield from self._iter_csv_chunks(file_path, chunk_size, start)
+            return
         
-        df.columns = df.columns.str.lower().str.strip().str.replace(' ', '_')
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = ['' if c is None else str(c) for c in header]
+            
+            offset = 0
+            chunk = []
+            for values in rows:
+                if offset < start:
+                    offset += 1
+                    continue
+                chunk.append(values)
+                if len(chunk) == chunk_size:
+                    yield self._excel_chunk(chunk, columns, offset)
+                    offset += len(chunk)
+                    chunk = []
+            if chunk:
+                yield self._excel_chunk(chunk, columns, offset)
+        finally:
+            workbook.close()
+    
+    def _read_table(self, file_path):
+        """Ler Parquet/Arrow IPC inteiro (colunas já tipadas)"""
+        return self._table_frame(self._arrow_table(file_path).to_pandas())
+    
+    def _iter_table_chunks(self, file_path, chunk_size, start=0):
+        """Ler Parquet/Arrow IPC em blocos de `chunk_size` linhas, a partir da linha `start`"""
+        if self._extension(file_path) == 'parquet':
+            batches = self._parquet_file(file_path).iter_batches(batch_size=chunk_size)
+        else:
+            batches = self._arrow_table(file_path).to_batches(max_chunksize=chunk_size)
         
-        stats = {'equipment_types_created': 0, 'instances_created': 0, 'errors': 0}
+        offset = 0
+        for batch in batches:
+            if offset + batch.num_rows <= start:
+                offset += batch.num_rows
+                continue
+            if offset < start:
+                batch = batch.slice(start - offset)
+                offset = start
+            df = batch.to_pandas()
+            df.index = range(offset, offset + len(df))
+            offset += len(df)
+            yield self._table_frame(df)
+    
+    def _table_frame(self, df):
+        """Colunas de texto vazio viram célula ausente, como na leitura do CSV/Excel"""
+        text = df.select_dtypes(include='object').columns
+        df[text] = df[text].mask(df[text].eq(''))
+        return self._normalize_columns(df)
+    
+    def _arrow_table(self, file_path):
+        """Tabela Arrow de um Parquet ou Arrow IPC"""
+        if self._extension(file_path) == 'parquet':
+            return self._parquet_file(file_path).read()
+        return pa.ipc.open_file(self._arrow_source(file_path)).read_all()
+    
+    def _parquet_file(self, file_path):
+        return pq.ParquetFile(self._arrow_source(file_path))
+    
+    def _arrow_source(self, file_path):
+        """Arquivo aberto para o pyarrow (mapeado em memória quando é um caminho)"""
+        if pa is None:
+            raise Exception("Leitura de Parquet/Arrow requer o pacote pyarrow (pip install pyarrow)")
+        if hasattr(file_path, 'read'):
+            return self._rewind(file_path)
+        return pa.memory_map(os.fspath(file_path))
+    
+    def _excel_chunk(self, rows, columns, offset):
+        """Montar DataFrame a partir de um bloco de linhas do openpyxl"""
+        width = len(columns)
+        df = pd.DataFrame(
+            [tuple(values[:width]) + (None,) * (width - len(values)) for values in rows],
+            columns=columns,
+            index=range(offset, offset + len(rows))
+        )
+        # Textos que o pd.read_excel lê como ausentes ('N/A', 'NULL', 'nan', '#N/A'...)
+        df = df.mask(df.isin(NA_STRINGS))
+        return self._normalize_columns(df)
+    
+    # ============== IMPORTAÇÃO EM BLOCOS ==============
+    
+    def _import_in_chunks(self, importer, file_path, read_chunks, normalize, write, stats, workers=None):
+        """
+        Executar uma importação bloco a bloco, com commit por bloco
         
-        for idx, row in df.iterrows():
-            try:
-                nome = str(row.get('nome', '')).strip() if pd.notna(row.get('nome')) else None
-                marca = str(row.get('marca', '')).strip() if pd.notna(row.get('marca')) else None
-                modelo = str(row.get('modelo', '')).strip() if pd.notna(row.get('modelo')) else None
-                patrimonial = str(row.get('patrimonial', '')).strip() if pd.notna(row.get('patrimonial')) else None
-                serial = str(row.get('serial', '')).strip() if pd.notna(row.get('serial')) else None
-                valor = float(row.get('valor', 0)) if pd.notna(row.get('valor')) else 0.0
-                
-                if not nome:
-                    continue
-                
-                eq_type = self.session.query(EquipmentType).filter_by(
-                    nome=nome, marca=marca, modelo=modelo
-                ).first()
-                
-                if not eq_type:
-                    eq_type = EquipmentType(nome=nome, marca=marca, modelo=modelo)
-                    self.session.add(eq_type)
-                    self.session.flush()
-                    stats['equipment_types_created'] += 1
-                
-                stock_item = StockItem(
-                    equipment_type_id=eq_type.id,
-                    quantidade=1,
-                    valor_unitario=valor,
-                    valor_total=valor,
-                    origem='import_csv'
-                )
-                self.session.add(stock_item)
-                self.session.flush()
-                
-                instance = EquipmentInstance(
-                    stock_item_id=stock_item.id,
-                    patrimonial=patrimonial,
-                    serial=serial,
-                    status=StatusEnum.disponivel
-                )
-                self.session.add(instance)
-                stats['instances_created'] += 1
-                
-            except Exception as e:
-                stats['errors'] += 1
-                print(f"Erro na linha {idx}: {e}")
+        O checkpoint avança na mesma transação de cada bloco; se a importação
+        for interrompida, a próxima execução sobre o mesmo arquivo recomeça a
+        partir do último bloco confirmado. Um bloco que falha é regravado em
+        metades (_write_bisecting) até isolar as linhas com problema.
+        """
+        checkpoint = self._get_checkpoint(importer, file_path)
+        stats['resumed_from'] = checkpoint.rows_committed
+        stats['chunks'] = 0
+        # Linhas cuja gravação falhou (ver _write_bisecting)
+        stats['discarded'] = 0
         
+        chunks = self._normalized_chunks(read_chunks(checkpoint.rows_committed), normalize, workers)
+        for df, normalized in chunks:
+            # Contagens e erros anteriores ao bloco, para desfazê-los se ele falhar
+            saved_stats = dict(stats)
+            saved_errors = len(self._pending_errors)
+            with self._writing():
+                try:
+                    self._apply(normalized, write, stats)
+                    checkpoint.rows_committed += len(df)
+                    self.session.commit()
+                except Exception as e:
+                    self._discard_transaction(stats, saved_stats, saved_errors)
+                    print(f"Erro no bloco de linhas {df.index[0]}-{df.index[-1]}: {self._error_message(e)}")
+                    records, errors = normalized
+                    for idx, message in errors:
+                        self._record_error(stats, idx, message)
+                    self._write_bisecting(records, write, stats, checkpoint)
+                    # Linhas rejeitadas na normalização, depois da última gravada
+                    checkpoint.rows_committed = int(df.index[-1]) + 1
+                    self.session.commit()
+            stats['chunks'] += 1
+            self._flush_errors()
+            self._report_progress(len(df), stats)
+        
+        checkpoint.finished_at = datetime.now()
         self.session.commit()
         return stats
+    
+    def _write_bisecting(self, records, write, stats, checkpoint):
+        """
+        Gravar registros de um bloco que falhou, em metades, até isolar as linhas com problema
+        
+        Cada parte gravada é confirmada junto com o checkpoint, que avança até
+        a última linha dela; uma linha que falha sozinha é descartada e entra
+        nos erros. Com `k` linhas problemáticas, são O(k log n) transações em
+        vez de perder o bloco inteiro.
+        """
+        if not records:
+            return
+        saved_stats = dict(stats)
+        saved_errors = len(self._pending_errors)
+        try:
+            write(records)
+            checkpoint.rows_committed = int(records[-1]['row']) + 1
+            self.session.commit()
+        except Exception as e:
+            self._discard_transaction(stats, saved_stats, saved_errors)
+            if len(records) == 1:
+                self._record_error(stats, records[0]['row'], f'Linha descartada: {self._error_message(e)}')
+                stats['discarded'] += 1
+                checkpoint.rows_committed = int(records[0]['row']) + 1
+                self.session.commit()
+                return
+            middle = len(records) // 2
+            self._write_bisecting(records[:middle], write, stats, checkpoint)
+            self._write_bisecting(records[middle:], write, stats, checkpoint)
+    
+    def _discard_transaction(self, stats, saved_stats, saved_errors):
+        """Desfazer a transação que falhou, com as contagens e erros anotados nela"""
+        self.session.rollback()
+        self._reset_caches()
+        stats.update(saved_stats)
+        del self._pending_errors[saved_errors:]
+    
+    def _error_message(self, error):
+        """Mensagem do erro, sem o SQL e os parâmetros que o SQLAlchemy acrescenta"""
+        return str(getattr(error, 'orig', None) or error)
+    
+    def _normalized_chunks(self, chunks, normalize, workers=None):
+        """
+        Normalizar blocos, opcionalmente em paralelo
+        
+        Com `workers` > 1, cada bloco é normalizado no pool de processos
+        compartilhado (normalize_pool) enquanto este processo continua sendo o
+        único a gravar no banco. Os resultados saem na ordem do arquivo e no
+        máximo 2 blocos por worker ficam em memória ao mesmo tempo.
+        """
+        if not workers or workers <= 1:
+            for df in chunks:
+                yield df, normalize(df)
+            return
+        
+        pending = deque()
+        for df in chunks:
+            pending.append((df, normalize_pool(workers).submit(normalize, df)))
+            if len(pending) >= workers * 2:
+                df, future = pending.popleft()
+                yield df, future.result()
+        while pending:
+            df, future = pending.popleft()
+            yield df, future.result()
+    
+    def _get_checkpoint(self, importer, file_path):
+        """Buscar checkpoint pendente do arquivo ou criar um novo"""
+        if hasattr(file_path, 'read'):
+            # Upload em memória: identificado pelo hash do conteúdo
+            source = f'sha256:{file_path.sha256}'
+            file_size = file_path.seek(0, os.SEEK_END)
+            file_path.seek(0)
+        else:
+            source = os.path.abspath(file_path)
+            file_size = os.path.getsize(file_path)
+        
+        checkpoint = self.session.query(ImportCheckpoint).filter_by(
+            importer=importer,
+            source=source,
+            file_size=file_size,
+            finished_at=None
+        ).order_by(ImportCheckpoint.id.desc()).first()
+        
+        if not checkpoint:
+            checkpoint = ImportCheckpoint(
+                importer=importer,
+                source=source,
+                file_size=file_size,
+                rows_committed=0
+            )
+            self.session.add(checkpoint)
+            self.session.commit()
+        return checkpoint
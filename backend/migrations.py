@@ -0,0 +1,120 @@
+"""
+Migrações do esquema
+
+`create_all` só cria tabelas que ainda não existem; mudanças em tabelas já
+existentes (índices, colunas novas) ficam aqui, numeradas em ordem. Cada
+banco registra em `schema_migrations` as versões aplicadas, e `init_db`
+aplica as pendentes ao abrir o banco. Bancos criados do zero já nascem com
+o esquema atual, então as migrações são apenas registradas.
+
+Cada passo é um comando SQL ou uma função que recebe a conexão. Os passos
+de uma migração rodam em uma única transação, junto com o registro da versão.
+
+Para aplicar as pendentes e ver o estado do banco:
+
+    python migrations.py
+"""
+from datetime import datetime
+
+from sqlalchemy import insert, select, text
+
+from models import SchemaMigration, FOLDED_USER_COLUMNS, fold_text
+from search import create_search_indexes
+
+def fill_folded_user_columns(conn):
+    """Preencher cidade_norm, cargo_norm e setor_norm (um UPDATE por valor distinto)"""
+    for name in FOLDED_USER_COLUMNS:
+        values = conn.execute(text(f'SELECT DISTINCT {name} FROM users WHERE {name} IS NOT NULL')).scalars()
+        params = [{'value': value, 'folded': fold_text(value)} for value in values]
+        if params:
+            conn.execute(text(f'UPDATE users SET {name}_norm = :folded WHERE {name} = :value'), params)
+
+MIGRATIONS = [
+    (1, 'índices dos filtros e relatórios', [
+        'CREATE INDEX IF NOT EXISTS ix_equipment_instances_status ON equipment_instances (status)',
+        'CREATE INDEX IF NOT EXISTS ix_equipment_instances_current_user_id ON equipment_instances (current_user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_equipment_instances_serial ON equipment_instances (serial)',
+        'CREATE INDEX IF NOT EXISTS ix_equipment_instances_stock_item_status '
+        'ON equipment_instances (stock_item_id, status)',
+        'CREATE INDEX IF NOT EXISTS ix_stock_items_type_valor ON stock_items (equipment_type_id, valor_total)',
+        'CREATE INDEX IF NOT EXISTS ix_movements_date ON movements (date)',
+        'CREATE INDEX IF NOT EXISTS ix_movements_instance_date ON movements (equipment_instance_id, date)',
+        'CREATE INDEX IF NOT EXISTS ix_import_checkpoints_importer_source ON import_checkpoints (importer, source)',
+        # Estatísticas para o planejador escolher entre os índices
+        'ANALYZE',
+    ]),
+    (2, 'busca textual FTS5 (usuários, tipos e instâncias)', [
+        create_search_indexes,
+    ]),
+    (3, 'cidade, cargo e setor normalizados (sem acento) para os filtros', [
+        'ALTER TABLE users ADD COLUMN cidade_norm VARCHAR(100)',
+        'ALTER TABLE users ADD COLUMN cargo_norm VARCHAR(100)',
+        'ALTER TABLE users ADD COLUMN setor_norm VARCHAR(100)',
+        fill_folded_user_columns,
+        'CREATE INDEX IF NOT EXISTS ix_users_cidade_norm ON users (cidade_norm)',
+        'CREATE INDEX IF NOT EXISTS ix_users_cargo_norm ON users (cargo_norm)',
+        'CREATE INDEX IF NOT EXISTS ix_users_setor_norm ON users (setor_norm)',
+        'ANALYZE users',
+    ]),
+    (4, 'índices dos filtros do estoque (data da nota e origem)', [
+        'CREATE INDEX IF NOT EXISTS ix_stock_items_nota_data ON stock_items (nota_data)',
+        'CREATE INDEX IF NOT EXISTS ix_stock_items_origem ON stock_items (origem)',
+        'ANALYZE stock_items',
+    ]),
+]
+
+def applied_versions(conn):
+    """Versões já registradas no banco"""
+    return set(conn.execute(select(SchemaMigration.version)).scalars())
+
+def lock_database(conn):
+    """Tomar a trava de escrita do banco até o fim da transação (SQLite: BEGIN IMMEDIATE)"""
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+def run_migrations(engine, stamp_only=False):
+    """
+    Aplicar as migrações pendentes, em ordem
+    
+    Com `stamp_only` (banco recém-criado pelo create_all), as versões são
+    apenas registradas. Retorna a lista de versões aplicadas agora.
+    
+    Vários processos podem abrir o mesmo banco ao mesmo tempo (workers do
+    servidor, scripts): cada migração toma a trava de escrita e confere de
+    novo se já foi aplicada antes de rodar os passos; quem chega depois
+    espera (até o busy_timeout) e encontra a versão registrada.
+    """
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+    
+    done = []
+    for version, name, steps in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            lock_database(conn)
+            if version in applied_versions(conn):
+                continue
+            if not stamp_only:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(text(step))
+            conn.execute(insert(SchemaMigration).values(version=version, name=name, applied_at=datetime.now()))
+        done.append(version)
+    return done
+
+if __name__ == '__main__':
+    from config import Config
+    from models import init_db
+    
+    engine = init_db(Config.SQLALCHEMY_DATABASE_URI, **Config.database_options())
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(SchemaMigration.version, SchemaMigration.name, SchemaMigration.applied_at)
+            .order_by(SchemaMigration.version)
+        ).all()
+    print("✓ Migrações aplicadas:")
+    for version, name, applied_at in rows:
+        print(f"  - {version:03d} {name} ({applied_at:%Y-%m-%d %H:%M})")
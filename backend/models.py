@@ -1,8 +1,13 @@
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Text, Enum, Date
+from sqlalchemy import (create_engine, event, Column, Integer, String, Float, DateTime, ForeignKey, Text, Enum,
+                        Date, UniqueConstraint, Index, inspect)
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 import enum
+import json
+import unicodedata
+from functools import lru_cache
 
 Base = declarative_base()
 
@@ -20,6 +25,20 @@ class MovementTypeEnum(enum.Enum):
     transferencia = "transferência"
     baixa = "baixa"
 
+@lru_cache(maxsize=4096)
+def fold_text(value):
+    """Texto para comparação: minúsculo, sem acentos e com espaços simples ('São  Paulo' -> 'sao paulo')"""
+    if value is None:
+        return None
+    text = str(value)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.lower().split()) or None
+
+# Colunas de usuário com cópia normalizada (fold_text), indexada para os filtros
+FOLDED_USER_COLUMNS = ('cidade', 'cargo', 'setor')
+
 class User(Base):
     """Funcionários/Usuários"""
     __tablename__ = 'users'
@@ -32,6 +51,10 @@ class User(Base):
     setor = Column(String(100))
     email = Column(String(200))
     matricula = Column(String(50), unique=True, nullable=True, index=True)
+    # Cópias normalizadas (sem acento/maiúsculas) de cidade, cargo e setor para os filtros
+    cidade_norm = Column(String(100), index=True)
+    cargo_norm = Column(String(100), index=True)
+    setor_norm = Column(String(100), index=True)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     created_at = Column(DateTime, default=datetime.now)
     
@@ -53,6 +76,17 @@ class User(Base):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+def folded_user_fields(fields):
+    """Colunas *_norm correspondentes a um dicionário com cidade, cargo e setor"""
+    return {f'{name}_norm': fold_text(fields.get(name)) for name in FOLDED_USER_COLUMNS}
+
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _fill_folded_user_fields(mapper, connection, target):
+    """Manter as colunas *_norm em dia nas gravações feitas pelo ORM"""
+    for name, value in folded_user_fields({c: getattr(target, c) for c in FOLDED_USER_COLUMNS}).items():
+        setattr(target, name, value)
+
 class EquipmentType(Base):
     """Tipos/Modelos de equipamentos"""
     __tablename__ = 'equipment_types'
@@ -80,15 +114,19 @@ class EquipmentType(Base):
 class StockItem(Base):
     """Item de estoque (entrada por nota fiscal)"""
     __tablename__ = 'stock_items'
+    __table_args__ = (
+        # Cobre o filtro por tipo e a soma de valores por tipo
+        Index('ix_stock_items_type_valor', 'equipment_type_id', 'valor_total'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     equipment_type_id = Column(Integer, ForeignKey('equipment_types.id'), nullable=False)
     nota_numero = Column(String(50))
-    nota_data = Column(Date)
+    nota_data = Column(Date, index=True)
     quantidade = Column(Integer, default=1)
     valor_unitario = Column(Float, default=0.0)
     valor_total = Column(Float, default=0.0)
-    origem = Column(String(200))  # Importação, compra, doação, etc
+    origem = Column(String(200), index=True)  # Importação, compra, doação, etc
     created_at = Column(DateTime, default=datetime.now)
     
     # Relacionamentos
@@ -112,13 +150,17 @@ class StockItem(Base):
 class EquipmentInstance(Base):
     """Instância individual de equipamento (com serial/patrimonial)"""
     __tablename__ = 'equipment_instances'
+    __table_args__ = (
+        # Instâncias de um item de estoque e contagens por status de cada item
+        Index('ix_equipment_instances_stock_item_status', 'stock_item_id', 'status'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     stock_item_id = Column(Integer, ForeignKey('stock_items.id'), nullable=False)
     patrimonial = Column(String(50), unique=True, nullable=True, index=True)
-    serial = Column(String(100), nullable=True)
-    status = Column(Enum(StatusEnum), default=StatusEnum.disponivel)
-    current_user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    serial = Column(String(100), nullable=True, index=True)
+    status = Column(Enum(StatusEnum), default=StatusEnum.disponivel, index=True)
+    current_user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
     assigned_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     
@@ -144,13 +186,17 @@ class EquipmentInstance(Base):
 class Movement(Base):
     """Histórico de movimentações"""
     __tablename__ = 'movements'
+    __table_args__ = (
+        # Histórico de uma instância em ordem cronológica
+        Index('ix_movements_instance_date', 'equipment_instance_id', 'date'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     equipment_instance_id = Column(Integer, ForeignKey('equipment_instances.id'), nullable=False)
     from_user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     to_user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
     type = Column(Enum(MovementTypeEnum), nullable=False)
-    date = Column(DateTime, default=datetime.now)
+    date = Column(DateTime, default=datetime.now, index=True)
     note = Column(Text)
     
     # Relacionamentos
@@ -188,10 +234,121 @@ class Invoice(Base):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-def init_db(database_url='sqlite:///database.db'):
-    """Inicializar banco de dados"""
-    engine = create_engine(database_url, echo=False)
+class ImportCheckpoint(Base):
+    """Progresso de importações em blocos (para retomada)"""
+    __tablename__ = 'import_checkpoints'
+    __table_args__ = (Index('ix_import_checkpoints_importer_source', 'importer', 'source'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    importer = Column(String(50), nullable=False)
+    source = Column(String(500), nullable=False)
+    file_size = Column(Integer)
+    rows_committed = Column(Integer, default=0)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'importer': self.importer,
+            'source': self.source,
+            'file_size': self.file_size,
+            'rows_committed': self.rows_committed,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class ImportedFile(Base):
+    """Arquivos já importados com sucesso, identificados pelo hash do conteúdo"""
+    __tablename__ = 'imported_files'
+    __table_args__ = (UniqueConstraint('sha256', 'kind'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    kind = Column(String(50), nullable=False)  # users, equipment
+    filename = Column(String(255))
+    path = Column(String(500))
+    stats = Column(Text)  # JSON com as estatísticas da importação
+    report_id = Column(String(32), nullable=True)
+    imported_at = Column(DateTime, default=datetime.now)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sha256': self.sha256,
+            'kind': self.kind,
+            'filename': self.filename,
+            'stats': json.loads(self.stats) if self.stats else None,
+            'imported_at': self.imported_at.isoformat() if self.imported_at else None
+        }
+
+class ImportFingerprint(Base):
+    """Impressão digital do conteúdo de cada registro na última importação"""
+    __tablename__ = 'import_fingerprints'
+    
+    kind = Column(String(50), primary_key=True)  # users, equipment
+    record_key = Column(String(50), primary_key=True)  # id do usuário ou patrimonial
+    fingerprint = Column(String(40), nullable=False)
+
+class SchemaMigration(Base):
+    """Migrações de esquema já aplicadas ao banco (ver migrations.py)"""
+    __tablename__ = 'schema_migrations'
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String(200))
+    applied_at = Column(DateTime, default=datetime.now)
+
+class InventoryCounter(Base):
+    """Contadores do estoque atualizados a cada escrita (resumo sem varrer as tabelas)"""
+    __tablename__ = 'inventory_counters'
+    
+    scope = Column(String(20), primary_key=True)  # status, type, total
+    key = Column(String(50), primary_key=True)  # nome do status, id do tipo ou 'estoque'
+    count = Column(Integer, nullable=False, default=0)  # instâncias de equipamento
+    value = Column(Float, nullable=False, default=0.0)  # soma de valor_total dos itens de estoque
+
+def _create_search_index(target, connection, **kw):
+    """Índice FTS5 da tabela em bancos novos (os existentes recebem pela migração 2)"""
+    from search import create_search_index
+    create_search_index(connection, target.name)
+
+for _table in (User.__table__, EquipmentType.__table__, EquipmentInstance.__table__):
+    event.listen(_table, 'after_create', _create_search_index)
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Executar os PRAGMAs em cada nova conexão SQLite do engine"""
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+def init_db(database_url='sqlite:///database.db', pragmas=None, pool_options=None):
+    """
+    Inicializar banco de dados
+    
+    `pragmas` (só SQLite) são aplicados a cada conexão, ex.: journal_mode=WAL.
+    `pool_options` (pool_size, max_overflow, pool_timeout, pool_recycle) valem
+    para bancos em arquivo; o SQLite em memória usa uma conexão só.
+    """
+    url = make_url(database_url)
+    is_sqlite = url.get_backend_name() == 'sqlite'
+    in_memory = is_sqlite and url.database in (None, '', ':memory:')
+    
+    options = dict(pool_options or {}) if not in_memory else {}
+    engine = create_engine(url, echo=False, **options)
+    if is_sqlite and pragmas:
+        apply_sqlite_pragmas(engine, pragmas)
+    
+    # Bancos novos já nascem com o esquema atual; os existentes recebem as migrações pendentes
+    from migrations import run_migrations
+    existing = inspect(engine).has_table(User.__tablename__)
     Base.metadata.create_all(engine)
+    run_migrations(engine, stamp_only=not existing)
     return engine
 
 def get_session(engine):
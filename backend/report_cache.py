@@ -0,0 +1,97 @@
+"""
+Cache das respostas de relatórios
+
+Cada resposta fica em memória (com o ETag calculado sobre o corpo) até que
+algum commit grave no banco: os commits avançam a geração dos dados e
+descartam todas as entradas. Respostas iguais às que o cliente já tem voltam
+como 304, sem corpo.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, make_response, current_app
+from sqlalchemy import event
+
+class ReportCache:
+    """Cache em memória, por rota e parâmetros, invalidado pelas escritas"""
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """(etag, corpo) da resposta em cache, ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, generation, body):
+        """
+        Guardar uma resposta calculada na geração `generation` e devolver o ETag
+        
+        Se houve escrita enquanto o relatório era calculado, a resposta não é
+        guardada (pode refletir dados antigos).
+        """
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            if generation == self.generation and self.max_entries > 0:
+                self._entries[key] = (etag, body)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return etag
+    
+    def invalidate(self):
+        """Avançar a geração dos dados e descartar todas as respostas"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+    
+    def watch(self, session_factory):
+        """Invalidar o cache a cada commit, das sessões da fábrica, que tenha gravado algo"""
+        @event.listens_for(session_factory, 'after_flush')
+        def flushed(session, flush_context):
+            session.info['report_cache_dirty'] = True
+        
+        @event.listens_for(session_factory, 'do_orm_execute')
+        def executed(orm_execute_state):
+            # INSERT/UPDATE/DELETE em massa não passam pelo flush
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                orm_execute_state.session.info['report_cache_dirty'] = True
+        
+        @event.listens_for(session_factory, 'after_commit')
+        def committed(session):
+            if session.info.pop('report_cache_dirty', False):
+                self.invalidate()
+        
+        @event.listens_for(session_factory, 'after_rollback')
+        def rolled_back(session):
+            session.info.pop('report_cache_dirty', None)
+    
+    def cached(self, view):
+        """Decorator: servir a rota do cache, com ETag e 304 para o que o cliente já tem"""
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = self.get(key)
+            if entry is None:
+                generation = self.generation
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                etag = self.put(key, generation, response.get_data())
+            else:
+                etag, body = entry
+                response = current_app.response_class(body, mimetype='application/json')
+            
+            response.set_etag(etag)
+            # O navegador guarda a resposta, mas revalida (If-None-Match) a cada uso
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return decorated_function
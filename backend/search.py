@@ -0,0 +1,91 @@
+"""
+Busca textual (SQLite FTS5)
+
+Cada tabela pesquisável tem uma tabela virtual FTS5 com tokenizador trigram
+(casa qualquer trecho de 3+ caracteres, sem diferenciar maiúsculas), de
+conteúdo externo: o texto fica só na tabela original e triggers mantêm o
+índice em dia a cada INSERT, UPDATE das colunas indexadas e DELETE.
+
+Buscas com menos de 3 caracteres não formam um trigrama e caem no LIKE.
+"""
+from sqlalchemy import select, or_, column, table, literal_column, text
+
+# tabela -> colunas indexadas
+SEARCH_COLUMNS = {
+    'users': ('nome', 'cpf', 'matricula'),
+    'equipment_types': ('nome', 'marca', 'modelo'),
+    'equipment_instances': ('patrimonial', 'serial'),
+}
+
+MIN_QUERY_LENGTH = 3
+
+def fts_name(table_name):
+    return f'{table_name}_fts'
+
+def search_index_ddl(table_name):
+    """Comandos que criam a tabela FTS5 e os triggers de sincronização"""
+    fts = fts_name(table_name)
+    columns = SEARCH_COLUMNS[table_name]
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table_name}', "
+        f"content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END",
+        # Só as colunas indexadas: destinação/devolução não mexem no índice
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+    ]
+
+def create_search_index(connection, table_name, rebuild=False):
+    """Criar o índice FTS5 de uma tabela (e, com `rebuild`, indexar as linhas existentes)"""
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in search_index_ddl(table_name):
+        connection.execute(text(statement))
+    if rebuild:
+        fts = fts_name(table_name)
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+def create_search_indexes(connection):
+    """Criar e popular os índices de todas as tabelas pesquisáveis (migração)"""
+    for table_name in SEARCH_COLUMNS:
+        create_search_index(connection, table_name, rebuild=True)
+
+def _uses_index(q):
+    return len(q) >= MIN_QUERY_LENGTH
+
+def _match(table_name, q):
+    """SELECT rowid FROM <tabela>_fts WHERE <tabela>_fts MATCH '"q"'"""
+    fts = fts_name(table_name)
+    # Frase entre aspas: o texto do usuário não é interpretado como sintaxe do FTS5
+    phrase = '"' + q.replace('"', '""') + '"'
+    return select(column('rowid')).select_from(table(fts)).where(literal_column(fts).op('MATCH')(phrase))
+
+def text_search(model, q):
+    """Condição de busca por trecho nas colunas indexadas do modelo"""
+    table_name = model.__tablename__
+    q = q.strip()
+    if not _uses_index(q):
+        return or_(*(getattr(model, c).ilike(f'%{q}%') for c in SEARCH_COLUMNS[table_name]))
+    return model.id.in_(_match(table_name, q))
+
+def ranked_search(session, model, q, limit, options=()):
+    """Até `limit` registros que contêm o trecho, do mais para o menos relevante (bm25)"""
+    table_name = model.__tablename__
+    q = q.strip()
+    query = session.query(model).options(*options)
+    if not _uses_index(q):
+        return query.filter(text_search(model, q)).order_by(model.id).limit(limit).all()
+    
+    ranked = _match(table_name, q).order_by(literal_column('rank')).limit(limit)
+    ids = list(session.execute(ranked).scalars())
+    if not ids:
+        return []
+    position = {row_id: i for i, row_id in enumerate(ids)}
+    return sorted(query.filter(model.id.in_(ids)).all(), key=lambda row: position[row.id])
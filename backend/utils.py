@@ -1,5 +1,10 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
 from functools import wraps
-from flask import request, jsonify
+from flask import Request, request, jsonify
 from config import Config
 
 def require_api_key(f):
@@ -17,6 +22,89 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
+def save_upload(file, folder, prefix, ext):
+    """
+    Salvar arquivo enviado (já recebido pelo UploadRequest, com o SHA-256)
+    
+    O nome final é derivado do conteúdo, então arquivos idênticos ficam
+    gravados uma única vez. Retorna (caminho, sha256).
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    with os.fdopen(fd, 'wb') as out:
+        shutil.copyfileobj(file.stream, out, 1024 * 1024)
+    sha256 = file.stream.sha256
+    
+    path = upload_path(folder, prefix, ext, sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return path, sha256
+
+def upload_path(folder, prefix, ext, sha256):
+    """Caminho (endereçado pelo conteúdo) de um arquivo enviado"""
+    return os.path.join(folder, f"{prefix}_{sha256}.{ext}")
+
+class SpooledUpload(tempfile.SpooledTemporaryFile):
+    """
+    Upload mantido em memória até `max_size` bytes (acima disso, em arquivo
+    temporário), para o importador ler direto do que foi recebido; o SHA-256
+    é calculado enquanto os bytes são gravados
+    """
+    
+    def __init__(self, max_size, extension=None):
+        super().__init__(max_size=max_size)
+        self.extension = extension
+        self._digest = hashlib.sha256()
+    
+    def write(self, data):
+        self._digest.update(data)
+        return super().write(data)
+    
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+class UploadRequest(Request):
+    """
+    Requisição que recebe os arquivos enviados direto em um SpooledUpload
+    
+    Sem isso o Werkzeug grava cada arquivo em um temporário próprio, que
+    depois precisaria ser copiado (e lido de novo para o hash).
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload(Config.IMPORT_SPOOL_MAX_SIZE)
+
+def detach_upload(file, ext):
+    """
+    Tirar de um arquivo da requisição o SpooledUpload recebido
+    
+    O Flask fecha os arquivos da requisição quando ela termina; o upload
+    passa a ser de quem o recebeu (ex.: importação em segundo plano).
+    """
+    upload = file.stream
+    upload.extension = ext
+    file.stream = io.BytesIO()
+    return upload
+
+def archive_upload(upload, path):
+    """Gravar em disco (para auditoria) um upload lido em memória e liberá-lo"""
+    try:
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.part"
+        upload.seek(0)
+        with open(tmp_path, 'wb') as out:
+            while True:
+                block = upload.read(1024 * 1024)
+                if not block:
+                    break
+                out.write(block)
+        os.replace(tmp_path, path)
+    finally:
+        upload.close()
+
 def format_currency(value):
     """Formatar valor monetário"""
     if not value:
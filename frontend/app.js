@@ -8,6 +8,8 @@ let allUsers = [];
 let allEquipmentTypes = [];
 let allStockItems = [];
 let allEquipmentInstances = [];
+let stockFilterTimer = null;
+let stockFilterRequest = 0;
 
 // ============== INICIALIZAÇÃO ==============
 
@@ -16,8 +18,15 @@ document.addEventListener('DOMContentLoaded', () => {
     loadDashboard();
     
     // Event listeners para busca
-    document.getElementById('stock-search')?.addEventListener('input', filterStock);
+    document.getElementById('stock-search')?.addEventListener('input', scheduleStockFilter);
+    document.getElementById('stock-origem-filter')?.addEventListener('input', scheduleStockFilter);
+    ['stock-type-filter', 'stock-date-from', 'stock-date-to', 'stock-available-filter'].forEach(id => {
+        document.getElementById(id)?.addEventListener('change', filterStock);
+    });
     document.getElementById('users-search')?.addEventListener('input', filterUsers);
+    document.getElementById('users-city-filter')?.addEventListener('change', filterUsers);
+    document.getElementById('assign-equipment-search')?.addEventListener('input', debounce(loadAvailableEquipment, 200));
+    document.getElementById('assign-user-search')?.addEventListener('input', debounce(loadUsersForAssign, 200));
     
     // Forms
     document.getElementById('assign-form')?.addEventListener('submit', handleAssign);
@@ -92,14 +101,27 @@ async function loadDashboard() {
 // ============== ESTOQUE ==============
 
 async function loadStock() {
+    await loadStockTypeFilter();
+    await filterStock();
+}
+
+async function loadStockTypeFilter() {
     try {
-        const response = await fetch(`${API_URL}/stock`);
-        const data = await response.json();
-        allStockItems = data;
-        renderStockTable(data);
+        const response = await fetch(`${API_URL}/facets?fields=equipment_type`);
+        const facets = await response.json();
+        
+        const select = document.getElementById('stock-type-filter');
+        const selected = select.value;
+        select.innerHTML = '<option value="">Todos os tipos</option>';
+        facets.equipment_type.forEach(type => {
+            const option = document.createElement('option');
+            option.value = type.value;
+            option.textContent = `${type.label} (${type.count})`;
+            select.appendChild(option);
+        });
+        select.value = selected;
     } catch (error) {
-        console.error('Erro ao carregar estoque:', error);
-        showNotification('Erro ao carregar estoque', 'error');
+        console.error('Erro ao carregar tipos:', error);
     }
 }
 
@@ -117,20 +139,51 @@ function renderStockTable(items) {
             <td>${item.nota_numero || '-'}</td>
             <td>${item.nota_data || '-'}</td>
             <td>${item.quantidade}</td>
+            <td>${item.instance_counts?.disponivel ?? '-'}</td>
             <td>${formatCurrency(item.valor_total)}</td>
         `;
     });
 }
 
-function filterStock() {
-    const query = document.getElementById('stock-search').value.toLowerCase();
-    const filtered = allStockItems.filter(item => {
-        const nome = item.equipment_type?.nome?.toLowerCase() || '';
-        const marca = item.equipment_type?.marca?.toLowerCase() || '';
-        const modelo = item.equipment_type?.modelo?.toLowerCase() || '';
-        return nome.includes(query) || marca.includes(query) || modelo.includes(query);
-    });
-    renderStockTable(filtered);
+function stockFilterParams() {
+    const params = new URLSearchParams();
+    const query = document.getElementById('stock-search').value.trim();
+    const typeId = document.getElementById('stock-type-filter').value;
+    const origem = document.getElementById('stock-origem-filter').value.trim();
+    const dateFrom = document.getElementById('stock-date-from').value;
+    const dateTo = document.getElementById('stock-date-to').value;
+    
+    if (query) params.set('q', query);
+    if (typeId) params.set('type_id', typeId);
+    if (origem) params.set('origem', origem);
+    if (dateFrom) params.set('nota_from', dateFrom);
+    if (dateTo) params.set('nota_to', dateTo);
+    if (document.getElementById('stock-available-filter').checked) params.set('available', '1');
+    return params;
+}
+
+function scheduleStockFilter() {
+    // Aguardar o usuário parar de digitar antes de consultar o servidor
+    clearTimeout(stockFilterTimer);
+    stockFilterTimer = setTimeout(filterStock, 300);
+}
+
+async function filterStock() {
+    // Os filtros são aplicados no servidor; respostas de consultas antigas são ignoradas
+    const requestId = ++stockFilterRequest;
+    try {
+        const response = await fetch(`${API_URL}/stock?${stockFilterParams()}`);
+        const data = await response.json();
+        if (requestId !== stockFilterRequest) return;
+        if (!response.ok) {
+            throw new Error(data.error || 'Erro ao filtrar estoque');
+        }
+        allStockItems = data;
+        renderStockTable(data);
+    } catch (error) {
+        console.error('Erro ao carregar estoque:', error);
+        showNotification('Erro ao carregar estoque', 'error');
+    }
 }
 
 // ============== USUÁRIOS ==============
@@ -141,7 +194,7 @@ async function loadUsers() {
         const data = await response.json();
         allUsers = data;
         renderUsersTable(data);
-        populateCityFilter(data);
+        populateCityFilter();
     } catch (error) {
         console.error('Erro ao carregar usuários:', error);
         showNotification('Erro ao carregar usuários', 'error');
@@ -168,18 +221,30 @@ function renderUsersTable(users) {
     });
 }
 
-function populateCityFilter(users) {
-    const cities = [...new Set(users.map(u => u.cidade).filter(c => c))];
-    const select = document.getElementById('users-city-filter');
-    select.innerHTML = '<option value="">Todas as cidades</option>';
-    cities.forEach(city => {
-        const option = document.createElement('option');
-        option.value = city;
-        option.textContent = city;
-        select.appendChild(option);
-    });
-    
-    select.addEventListener('change', filterUsers);
+async function populateCityFilter() {
+    // Cidades distintas com contagens, calculadas (e guardadas em cache) no servidor
+    try {
+        const response = await fetch(`${API_URL}/facets?fields=cidade`);
+        const facets = await response.json();
+        
+        const select = document.getElementById('users-city-filter');
+        const selected = select.value;
+        select.innerHTML = '<option value="">Todas as cidades</option>';
+        facets.cidade.forEach(city => {
+            const option = document.createElement('option');
+            option.value = city.value;
+            option.textContent = `${city.value} (${city.count})`;
+            select.appendChild(option);
+        });
+        select.value = selected;
+    } catch (error) {
+        console.error('Erro ao carregar cidades:', error);
+    }
+}
+
+function foldText(value) {
+    // Mesma comparação do servidor: sem acentos e sem diferenciar maiúsculas
+    return (value || '').normalize('NFKD').replace(/[\u0300-\u036f]/g, '').toLowerCase().split(/\s+/).filter(Boolean).join(' ');
 }
 
 function filterUsers() {
@@ -190,7 +255,7 @@ function filterUsers() {
         const matchQuery = user.nome.toLowerCase().includes(query) || 
                           (user.cpf && user.cpf.includes(query)) ||
                           (user.matricula && user.matricula.includes(query));
-        const matchCity = !city || user.cidade === city;
+        const matchCity = !city || foldText(user.cidade) === foldText(city);
         return matchQuery && matchCity;
     });
     
@@ -205,20 +270,46 @@ async function loadAssignView() {
     await loadAllocatedEquipment();
 }
 
+// Última busca de cada campo: respostas de buscas anteriores são ignoradas
+const assignSearchRequests = {};
+
+async function fillAssignSelect(selectId, searchId, url, emptyLabel, optionLabel) {
+    const select = document.getElementById(selectId);
+    const query = document.getElementById(searchId).value.trim();
+    const requestId = (assignSearchRequests[selectId] || 0) + 1;
+    assignSearchRequests[selectId] = requestId;
+    
+    if (!query) {
+        select.innerHTML = `<option value="">Digite para buscar ${emptyLabel}</option>`;
+        return;
+    }
+    
+    // Só os primeiros resultados que começam com o texto digitado (autocompletar no servidor)
+    const response = await fetch(`${url}${url.includes('?') ? '&' : '?'}q=${encodeURIComponent(query)}`);
+    const data = await response.json();
+    if (assignSearchRequests[selectId] !== requestId) return;
+    
+    select.innerHTML = '';
+    const placeholder = document.createElement('option');
+    placeholder.value = '';
+    placeholder.textContent = data.length ? `Selecione ${emptyLabel}` : `Nenhum resultado para "${query}"`;
+    select.appendChild(placeholder);
+    data.forEach(item => {
+        const option = document.createElement('option');
+        option.value = item.id;
+        option.textContent = optionLabel(item);
+        select.appendChild(option);
+    });
+    if (data.length === 1) {
+        select.value = data[0].id;
+    }
+}
+
 async function loadAvailableEquipment() {
     try {
-        const response = await fetch(`${API_URL}/equipment-instances?status=disponivel`);
-        const data = await response.json();
-        
-        const select = document.getElementById('assign-equipment');
-        select.innerHTML = '<option value="">Selecione um equipamento</option>';
-        
-        data.forEach(eq => {
-            const option = document.createElement('option');
-            option.value = eq.id;
-            option.textContent = `${eq.stock_item?.equipment_type?.nome || 'Equipamento'} - ${eq.patrimonial || eq.serial || eq.id}`;
-            select.appendChild(option);
-        });
+        await fillAssignSelect('assign-equipment', 'assign-equipment-search',
+            `${API_URL}/autocomplete/equipment?status=disponivel`, 'um equipamento',
+            eq => `${eq.stock_item?.equipment_type?.nome || 'Equipamento'} - ${eq.patrimonial || eq.serial || eq.id}`);
     } catch (error) {
         console.error('Erro ao carregar equipamentos disponíveis:', error);
     }
@@ -226,18 +317,9 @@ async function loadAvailableEquipment() {
 
 async function loadUsersForAssign() {
     try {
-        const response = await fetch(`${API_URL}/users`);
-        const data = await response.json();
-        
-        const select = document.getElementById('assign-user');
-        select.innerHTML = '<option value="">Selecione um usuário</option>';
-        
-        data.forEach(user => {
-            const option = document.createElement('option');
-            option.value = user.id;
-            option.textContent = `${user.nome} - ${user.cargo || ''} (${user.cidade || ''})`;
-            select.appendChild(option);
-        });
+        await fillAssignSelect('assign-user', 'assign-user-search',
+            `${API_URL}/autocomplete/users`, 'um usuário',
+            user => `${user.nome} - ${user.cargo || ''} (${user.cidade || ''})`);
     } catch (error) {
         console.error('Erro ao carregar usuários:', error);
     }
@@ -462,6 +544,9 @@ async function importUsers() {
     
     const formData = new FormData();
     formData.append('file', file);
+    if (document.getElementById('import-users-delta').checked) {
+        formData.append('delta', '1');
+    }
     
     try {
         const response = await fetch(`${API_URL}/import/users`, {
@@ -475,10 +560,13 @@ async function importUsers() {
         const data = await response.json();
         
         if (response.ok) {
+            const result = data.job_id ? await pollImportJob(data.job_id) : data;
+            const stats = result.stats;
             document.getElementById('import-result').innerHTML = `
                 <div class="success-message">
-                    <p>Importação concluída com sucesso!</p>
-                    <p>Criados: ${data.stats.created} | Atualizados: ${data.stats.updated} | Erros: ${data.stats.errors}</p>
+                    <p>${result.cached ? 'Arquivo já importado anteriormente; nada foi reprocessado.' : 'Importação concluída com sucesso!'}</p>
+                    <p>Criados: ${stats.created} | Atualizados: ${stats.updated} | Inalterados: ${stats.unchanged || 0} | Erros: ${stats.errors}</p>
+                    ${errorReportLink(result.error_report)}
                 </div>
             `;
             fileInput.value = '';
@@ -502,6 +590,9 @@ async function importEquipment() {
     
     const formData = new FormData();
     formData.append('file', file);
+    if (document.getElementById('import-equipment-delta').checked) {
+        formData.append('delta', '1');
+    }
     
     try {
         const response = await fetch(`${API_URL}/import/equipment`, {
@@ -515,10 +606,13 @@ async function importEquipment() {
         const data = await response.json();
         
         if (response.ok) {
+            const result = data.job_id ? await pollImportJob(data.job_id) : data;
+            const stats = result.stats;
             document.getElementById('import-result').innerHTML = `
                 <div class="success-message">
-                    <p>Importação concluída com sucesso!</p>
-                    <p>Tipos criados: ${data.stats.equipment_types_created} | Instâncias: ${data.stats.instances_created} | Erros: ${data.stats.errors}</p>
+                    <p>${result.cached ? 'Arquivo já importado anteriormente; nada foi reprocessado.' : 'Importação concluída com sucesso!'}</p>
+                    <p>Tipos criados: ${stats.equipment_types_created} | Instâncias: ${stats.instances_created} | Atualizadas: ${stats.instances_updated || 0} | Inalterados: ${stats.unchanged || 0} | Erros: ${stats.errors}</p>
+                    ${errorReportLink(result.error_report)}
                 </div>
             `;
             fileInput.value = '';
@@ -531,6 +625,44 @@ async function importEquipment() {
     }
 }
 
+async function pollImportJob(jobId) {
+    // Acompanhar importação em segundo plano até terminar
+    const output = document.getElementById('import-result');
+    
+    while (true) {
+        const response = await fetch(`${API_URL}/import/jobs/${jobId}`);
+        const job = await response.json();
+        
+        if (!response.ok) {
+            throw new Error(job.error || 'Importação não encontrada');
+        }
+        if (job.status === 'finished') {
+            return job;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Falha na importação');
+        }
+        
+        const total = job.total_rows ? ` de ${job.total_rows}` : '';
+        const eta = job.eta_seconds !== null ? ` | Restante: ~${Math.ceil(job.eta_seconds)}s` : '';
+        output.innerHTML = `
+            <div class="info-message">
+                <p>Importando... ${job.rows_processed}${total} linhas (${job.throughput} linhas/s)${eta}</p>
+                <p>Erros até agora: ${job.errors}</p>
+            </div>
+        `;
+        
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+function errorReportLink(url) {
+    // Link para o CSV com as linhas rejeitadas na importação
+    if (!url) return '';
+    const href = `${API_URL}${url.replace(/^\/api/, '')}?api_key=${encodeURIComponent(API_KEY)}`;
+    return `<p><a href="${href}" download>Baixar relatório de erros (CSV)</a></p>`;
+}
+
 // ============== MODAL DE ESTOQUE ==============
 
 async function showAddStockModal() {
@@ -611,6 +743,15 @@ async function handleAddStock(e) {
 
 // ============== UTILIDADES ==============
 
+function debounce(fn, delay) {
+    // Chamar `fn` só quando o usuário parar de digitar por `delay` ms
+    let timer = null;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), delay);
+    };
+}
+
 function formatCurrency(value) {
     if (!value) return 'R$ 0,00';
     return new Intl.NumberFormat('pt-BR', {
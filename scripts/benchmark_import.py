@@ -0,0 +1,280 @@
+"""
+Benchmark das importações (ImportService)
+
+Gera arquivos sintéticos de usuários e equipamentos (CPFs válidos, tipos
+repetidos, linhas duplicadas e inválidas), importa cada um em um banco
+SQLite novo e mede linhas/s, pico de memória (RSS) e número de comandos SQL.
+
+Cada execução roda em um processo próprio, para que o pico de RSS seja só
+daquela importação. Exemplos:
+
+    python scripts/benchmark_import.py
+    python scripts/benchmark_import.py --sizes 1000,10000 --only users_csv,equipment_xlsx
+    python scripts/benchmark_import.py --sizes 1000000 --chunk-size 50000 --json resultado.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Execuções disponíveis: nome -> (arquivo gerado, método do ImportService)
+RUNS = {
+    'users_csv': ('users', 'csv', 'import_users_from_csv'),
+    'users_parquet': ('users', 'parquet', 'import_users_from_parquet'),
+    'equipment_csv': ('equipment', 'csv', 'import_equipment_from_csv'),
+    'equipment_xlsx': ('equipment', 'xlsx', 'import_equipment_from_excel'),
+    'equipment_parquet': ('equipment', 'parquet', 'import_equipment_from_parquet'),
+}
+
+CIDADES = ['São Paulo', 'Rio de Janeiro', 'Belo Horizonte', 'Curitiba', 'Porto Alegre',
+           'Salvador', 'Recife', 'Fortaleza', 'Goiânia', 'Campinas']
+CARGOS = ['Analista', 'Assistente', 'Coordenador', 'Gerente', 'Técnico', 'Estagiário', 'Diretor']
+SETORES = ['TI', 'RH', 'Financeiro', 'Comercial', 'Operações', 'Jurídico', 'Marketing']
+EQUIPAMENTOS = [('Notebook', 'Dell', 'Latitude 5420'), ('Notebook', 'Lenovo', 'ThinkPad T14'),
+                ('Notebook', 'HP', 'EliteBook 840'), ('Monitor', 'LG', '24MK430H'),
+                ('Monitor', 'Samsung', 'S24R350'), ('Mouse', 'Logitech', 'M90'),
+                ('Teclado', 'Logitech', 'K120'), ('Headset', 'JBL', 'Quantum 100'),
+                ('Celular', 'Samsung', 'Galaxy A34'), ('Celular', 'Motorola', 'Moto G84'),
+                ('Desktop', 'Dell', 'OptiPlex 3000'), ('Impressora', 'HP', 'LaserJet M404')]
+STATUS = ['disponível', 'alocado', 'alocado', 'em manutenção', 'baixado']
+
+# ============== DADOS SINTÉTICOS ==============
+
+def make_cpf(number):
+    """CPF válido (com dígitos verificadores) a partir de um número de até 9 dígitos"""
+    digits = [int(d) for d in f'{number % 10 ** 9:09d}']
+    for _ in range(2):
+        total = sum(d * w for d, w in zip(digits, range(len(digits) + 1, 1, -1)))
+        digits.append(total * 10 % 11 % 10)
+    return ''.join(map(str, digits))
+
+def user_rows(size, seed=42):
+    """
+    Linhas de usuários: ~3% repetem o CPF de uma linha anterior (atualização),
+    ~1% sem nome (ignoradas), ~10% sem matrícula e ~0,5% com o CPF de um
+    usuário sem matrícula e a matrícula de outro (erro)
+    """
+    rng = random.Random(seed)
+    rows = []
+    without_matricula = []
+    with_matricula = []
+    for i in range(size):
+        roll = rng.random()
+        if rows and roll < 0.03:
+            row = dict(rng.choice(rows), cargo=rng.choice(CARGOS))
+        elif without_matricula and with_matricula and roll < 0.035:
+            # Preencher a matrícula vazia com a de outro usuário viola a unicidade
+            row = dict(rng.choice(without_matricula), cargo=rng.choice(CARGOS),
+                       matricula=rng.choice(with_matricula)['matricula'])
+        else:
+            cpf = make_cpf(i + 1)
+            row = {
+                'nome': '' if roll > 0.99 else f'Funcionário {i}',
+                # Parte dos CPFs vem formatada, parte só com dígitos
+                'cpf': f'{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}' if i % 2 else cpf,
+                'cargo': rng.choice(CARGOS),
+                'cidade': rng.choice(CIDADES),
+                'setor': rng.choice(SETORES),
+                'matricula': '' if roll > 0.89 else f'M{i:07d}',
+                'email': f'funcionario{i}@empresa.com.br'
+            }
+            if row['nome']:
+                (with_matricula if row['matricula'] else without_matricula).append(row)
+        rows.append(row)
+    return rows
+
+def equipment_rows(size, seed=42):
+    """
+    Linhas de equipamentos: tipos repetidos, ~2% com patrimonial duplicado,
+    ~1% com valor inválido, ~0,5% com data inválida e ~0,5% sem nome
+    """
+    rng = random.Random(seed)
+    start = date(2018, 1, 1)
+    rows = []
+    for i in range(size):
+        nome, marca, modelo = rng.choice(EQUIPAMENTOS)
+        roll = rng.random()
+        rows.append({
+            'nome': '' if roll > 0.995 else nome,
+            'marca': marca,
+            'modelo': modelo,
+            'patrimonial': f'PAT{rng.randrange(max(i, 1)):08d}' if roll < 0.02 else f'PAT{i:08d}',
+            'serial': f'SN{rng.getrandbits(40):010X}',
+            'valor': 'abc' if 0.02 <= roll < 0.03 else round(rng.uniform(50, 9000), 2),
+            'data_aquisicao': ('não é data' if 0.03 <= roll < 0.035
+                               else (start + timedelta(days=rng.randrange(2500))).isoformat()),
+            'status': rng.choice(STATUS)
+        })
+    return rows
+
+def typed_frame(kind, rows):
+    """DataFrame com colunas tipadas, como um ERP exportaria em Parquet"""
+    df = pd.DataFrame(rows)
+    if kind == 'equipment':
+        df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
+        df['data_aquisicao'] = pd.to_datetime(df['data_aquisicao'], errors='coerce')
+    return df
+
+def write_file(kind, fmt, size, data_dir):
+    """Gerar (uma vez) o arquivo sintético e devolver o caminho"""
+    path = os.path.join(data_dir, f'{kind}_{size}.{fmt}')
+    if os.path.exists(path):
+        return path
+
+    rows = user_rows(size) if kind == 'users' else equipment_rows(size)
+    if fmt == 'csv':
+        pd.DataFrame(rows).to_csv(path, index=False)
+    elif fmt == 'parquet':
+        typed_frame(kind, rows).to_parquet(path, index=False)
+    else:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(list(rows[0]))
+        for row in rows:
+            sheet.append(list(row.values()))
+        workbook.save(path)
+    return path
+
+# ============== EXECUÇÃO ==============
+
+def peak_rss_mb():
+    """Pico de memória residente do processo atual, em MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_import(method, file_path, db_path, chunk_size=None, workers=None):
+    """Importar um arquivo em um banco novo (executado em processo próprio)"""
+    from sqlalchemy import event
+    from models import init_db, get_session
+    from import_service import ImportService
+
+    engine = init_db(f'sqlite:///{db_path}')
+    counts = {'statements': 0, 'executemany': 0}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counts['statements'] += 1
+        if executemany:
+            counts['executemany'] += 1
+
+    session = get_session(engine)
+    kwargs = {}
+    if chunk_size or workers:
+        kwargs = {'chunk_size': chunk_size, 'workers': workers}
+
+    # As linhas rejeitadas são impressas uma a uma; o benchmark não precisa delas
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        stats = getattr(ImportService(session), method)(file_path, **kwargs)
+        elapsed = time.perf_counter() - started
+    session.close()
+    engine.dispose()
+
+    return {
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+        'statements': counts['statements'],
+        'executemany': counts['executemany'],
+        'stats': stats
+    }
+
+def benchmark(name, size, data_dir, chunk_size=None, workers=None):
+    kind, fmt, method = RUNS[name]
+    file_path = write_file(kind, fmt, size, data_dir)
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_path = os.path.join(db_dir, 'benchmark.db')
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_import, method, file_path, db_path, chunk_size, workers).result()
+
+    result.update({
+        'name': name,
+        'rows': size,
+        'rows_per_second': size / result['seconds'] if result['seconds'] else None
+    })
+    return result
+
+def print_result(result):
+    rss = f"{result['peak_rss_mb']:.0f}" if result['peak_rss_mb'] is not None else '-'
+    print(f"{result['name']:<18} {result['rows']:>9} {result['seconds']:>9.2f} "
+          f"{result['rows_per_second']:>11.0f} {rss:>8} {result['statements']:>8} "
+          f"{result['stats'].get('errors', 0):>7}")
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das importações')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='quantidades de linhas, separadas por vírgula')
+    parser.add_argument('--only', help=f"execuções, separadas por vírgula ({', '.join(RUNS)})")
+    parser.add_argument('--chunk-size', type=int, help='importar em blocos deste tamanho')
+    parser.add_argument('--workers', type=int, help='processos para normalização paralela')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'organizador_benchmark'),
+                        help='onde gerar (e reaproveitar) os arquivos sintéticos')
+    parser.add_argument('--json', help='salvar os resultados neste arquivo')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    names = args.only.split(',') if args.only else list(RUNS)
+    unknown = [name for name in names if name not in RUNS]
+    if unknown:
+        parser.error(f"execução desconhecida: {', '.join(unknown)}")
+    if not has_pyarrow():
+        skipped = [name for name in names if RUNS[name][1] == 'parquet']
+        if skipped:
+            print(f"pyarrow não instalado; ignorando: {', '.join(skipped)}")
+        names = [name for name in names if name not in skipped]
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    print(f"{'execução':<18} {'linhas':>9} {'segundos':>9} {'linhas/s':>11} {'RSS (MB)':>8} "
+          f"{'SQL':>8} {'erros':>7}")
+
+    results = []
+    for size in sizes:
+        for name in names:
+            result = benchmark(name, size, args.data_dir, args.chunk_size, args.workers)
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'sizes': sizes,
+                'chunk_size': args.chunk_size,
+                'workers': args.workers,
+                'results': results
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Resultados salvos em: {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmark de concorrência do SQLite (leituras x escritas)
+
+Popula um banco com usuários e equipamentos e, por alguns segundos, roda em
+paralelo leitores (consultas das listagens e do resumo de estoque) e escritores
+(destinação/devolução, como em /api/assign e /api/return). Compara o banco com
+as configurações padrão do SQLite e com o perfil de desempenho do Config
+(WAL, synchronous=NORMAL, mmap, cache e busy_timeout).
+
+Cada perfil roda em um processo próprio, com um banco novo. Exemplos:
+
+    python scripts/benchmark_sqlite.py
+    python scripts/benchmark_sqlite.py --readers 8 --writers 2 --seconds 20
+    python scripts/benchmark_sqlite.py --instances 100000 --json resultado.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+PROFILES = ['padrao', 'desempenho']
+
+ORIGENS = ['benchmark', 'import_csv', 'import_excel', 'manual']
+
+# ============== DADOS ==============
+
+def populate(engine, users, instances, seed=42):
+    """
+    Inserir usuários, tipos, itens de estoque e as instâncias
+
+    Tipos (um para cada 10 instâncias) e itens de estoque (um para cada 4)
+    crescem com `instances`, com origens e datas de nota variadas, para que
+    os filtros de /api/stock e /api/equipment-types rodem sobre tabelas do
+    tamanho de um banco em uso.
+    """
+    from datetime import date, timedelta
+    from sqlalchemy import insert
+    from models import User, EquipmentType, StockItem, EquipmentInstance, StatusEnum, folded_user_fields
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    types = max(20, instances // 10)
+    items = max(20, instances // 4)
+    # Inserção em massa: as colunas normalizadas (*_norm) são preenchidas aqui
+    profile = {'cidade': 'São Paulo', 'cargo': None, 'setor': 'TI'}
+    profile.update(folded_user_fields(profile))
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            dict(profile, nome=f'Funcionário {i}', cpf=f'{i:011d}', matricula=f'M{i:07d}',
+                 updated_at=now, created_at=now)
+            for i in range(users)
+        ])
+        conn.execute(insert(EquipmentType), [
+            {'nome': f'Tipo {i}', 'marca': f'Marca {i % 25}', 'modelo': f'Modelo {i}', 'created_at': now}
+            for i in range(types)
+        ])
+        conn.execute(insert(StockItem), [
+            {'equipment_type_id': i % types + 1, 'quantidade': 0, 'valor_unitario': 100.0,
+             'valor_total': 0.0, 'origem': rng.choice(ORIGENS),
+             'nota_data': date(2022, 1, 1) + timedelta(days=rng.randrange(1095)), 'created_at': now}
+            for i in range(items)
+        ])
+        conn.execute(insert(EquipmentInstance), [
+            {'stock_item_id': rng.randrange(items) + 1, 'patrimonial': f'PAT{i:08d}',
+             'serial': f'SN{i:010d}', 'status': StatusEnum.disponivel, 'created_at': now}
+            for i in range(instances)
+        ])
+
+# ============== CARGA ==============
+
+def reader(Session, stop, result, page_size):
+    """Listagem paginada de instâncias disponíveis + resumo de estoque"""
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import joinedload
+    from models import EquipmentInstance, StockItem, StatusEnum
+
+    rng = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        session = Session()
+        try:
+            cursor = rng.randrange(max(result['instances'] - page_size, 1))
+            session.scalars(
+                select(EquipmentInstance)
+                .options(joinedload(EquipmentInstance.stock_item).joinedload(StockItem.equipment_type))
+                .filter(EquipmentInstance.status == StatusEnum.disponivel, EquipmentInstance.id > cursor)
+                .order_by(EquipmentInstance.id)
+                .limit(page_size)
+            ).all()
+            session.execute(
+                select(EquipmentInstance.status, func.count()).group_by(EquipmentInstance.status)
+            ).all()
+            result['latencies'].append(time.perf_counter() - started)
+        except Exception as e:
+            result['errors'].append(str(e))
+        finally:
+            session.close()
+
+def writer(Session, stop, result):
+    """Destinar e devolver instâncias aleatórias, uma transação por operação"""
+    from models import EquipmentInstance, Movement, StatusEnum, MovementTypeEnum
+
+    rng = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        session = Session()
+        try:
+            instance = session.get(EquipmentInstance, rng.randrange(result['instances']) + 1)
+            if instance.status == StatusEnum.alocado:
+                movement = Movement(equipment_instance_id=instance.id, from_user_id=instance.current_user_id,
+                                    type=MovementTypeEnum.devolucao)
+                instance.status = StatusEnum.disponivel
+                instance.current_user_id = None
+                instance.assigned_at = None
+            else:
+                user_id = rng.randrange(result['users']) + 1
+                movement = Movement(equipment_instance_id=instance.id, to_user_id=user_id,
+                                    type=MovementTypeEnum.destinacao)
+                instance.status = StatusEnum.alocado
+                instance.current_user_id = user_id
+                instance.assigned_at = datetime.now()
+            session.add(movement)
+            session.commit()
+            result['latencies'].append(time.perf_counter() - started)
+        except Exception as e:
+            session.rollback()
+            result['errors'].append(str(e))
+        finally:
+            session.close()
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def summarize(result, seconds):
+    latencies = result['latencies']
+    p50 = percentile(latencies, 0.5)
+    p95 = percentile(latencies, 0.95)
+    return {
+        'operations': len(latencies),
+        'per_second': len(latencies) / seconds,
+        'p50_ms': p50 * 1000 if p50 is not None else None,
+        'p95_ms': p95 * 1000 if p95 is not None else None,
+        'errors': len(result['errors']),
+        'first_error': result['errors'][0] if result['errors'] else None
+    }
+
+def run_profile(profile, db_path, users, instances, readers, writers, seconds, page_size):
+    """Popular um banco novo e rodar a carga mista (executado em processo próprio)"""
+    from sqlalchemy.orm import sessionmaker
+    from config import Config
+    from models import init_db
+
+    options = Config.database_options()
+    if profile == 'padrao':
+        options['pragmas'] = None
+    engine = init_db(f'sqlite:///{db_path}', **options)
+    populate(engine, users, instances)
+    Session = sessionmaker(bind=engine)
+
+    stop = threading.Event()
+    read_result = {'latencies': [], 'errors': [], 'users': users, 'instances': instances}
+    write_result = {'latencies': [], 'errors': [], 'users': users, 'instances': instances}
+    threads = ([threading.Thread(target=reader, args=(Session, stop, read_result, page_size))
+                for _ in range(readers)] +
+               [threading.Thread(target=writer, args=(Session, stop, write_result))
+                for _ in range(writers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+    engine.dispose()
+
+    return {
+        'profile': profile,
+        'journal_mode': journal_mode,
+        'reads': summarize(read_result, seconds),
+        'writes': summarize(write_result, seconds)
+    }
+
+def benchmark(profile, args):
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_path = os.path.join(db_dir, 'benchmark.db')
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            return pool.submit(run_profile, profile, db_path, args.users, args.instances, args.readers,
+                               args.writers, args.seconds, args.page_size).result()
+
+def print_result(result):
+    for label, key in (('leituras', 'reads'), ('escritas', 'writes')):
+        data = result[key]
+        p50 = f"{data['p50_ms']:.1f}" if data['p50_ms'] is not None else '-'
+        p95 = f"{data['p95_ms']:.1f}" if data['p95_ms'] is not None else '-'
+        print(f"{result['profile']:<11} {result['journal_mode']:<8} {label:<9} {data['operations']:>8} "
+              f"{data['per_second']:>9.1f} {p50:>9} {p95:>9} {data['errors']:>6}")
+        if data['first_error']:
+            print(f"{'':<11} └ {data['first_error'][:100]}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de concorrência do SQLite')
+    parser.add_argument('--profiles', default=','.join(PROFILES),
+                        help=f"perfis, separados por vírgula ({', '.join(PROFILES)})")
+    parser.add_argument('--users', type=int, default=5000, help='usuários no banco')
+    parser.add_argument('--instances', type=int, default=50000, help='instâncias de equipamento no banco')
+    parser.add_argument('--readers', type=int, default=4, help='threads de leitura')
+    parser.add_argument('--writers', type=int, default=2, help='threads de escrita')
+    parser.add_argument('--seconds', type=float, default=10, help='duração da carga de cada perfil')
+    parser.add_argument('--page-size', type=int, default=100, help='linhas por página nas leituras')
+    parser.add_argument('--json', help='salvar os resultados neste arquivo')
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(',')
+    unknown = [profile for profile in profiles if profile not in PROFILES]
+    if unknown:
+        parser.error(f"perfil desconhecido: {', '.join(unknown)}")
+
+    print(f"{'perfil':<11} {'journal':<8} {'operação':<9} {'total':>8} {'ops/s':>9} {'p50 (ms)':>9} "
+          f"{'p95 (ms)':>9} {'erros':>6}")
+
+    results = []
+    for profile in profiles:
+        result = benchmark(profile, args)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'users': args.users,
+                'instances': args.instances,
+                'readers': args.readers,
+                'writers': args.writers,
+                'seconds': args.seconds,
+                'results': results
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Resultados salvos em: {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""
+Verificação de casos conhecidos das importações (ImportService)
+
+Cada caso cria um banco SQLite temporário, grava o estado inicial, importa
+um arquivo pequeno e confere o resultado (usuários gravados, estatísticas,
+relatório de erros) contra o comportamento do importador linha a linha
+original. Os casos cobrem regressões já encontradas nos caminhos em lote.
+
+    python scripts/check_imports.py
+    python scripts/check_imports.py --only users_cpf_before_matricula
+
+Termina com código 1 se algum caso falhar.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import traceback
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+CASES = []
+
+def case(function):
+    """Registrar um caso de verificação"""
+    CASES.append(function)
+    return function
+
+class Check:
+    """Banco temporário e arquivos de um caso"""
+
+    def __init__(self, workdir):
+        from models import init_db, get_session
+
+        self.workdir = workdir
+        self.engine = init_db(f"sqlite:///{os.path.join(workdir, 'check.db')}")
+        self.session = get_session(self.engine)
+        self.failures = []
+
+    def write(self, name, content):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def write_excel(self, name, rows):
+        """Planilha com as linhas (dicionários) dadas; células ausentes ficam vazias"""
+        import pandas as pd
+
+        path = os.path.join(self.workdir, name)
+        pd.DataFrame(rows).to_excel(path, index=False)
+        return path
+
+    def write_parquet(self, name, rows):
+        """Parquet com as linhas (dicionários) dadas, colunas de texto como no arquivo"""
+        import pandas as pd
+
+        path = os.path.join(self.workdir, name)
+        pd.DataFrame(rows).to_parquet(path, index=False)
+        return path
+
+    def service(self, **kwargs):
+        from import_service import ImportService
+        return ImportService(self.session, **kwargs)
+
+    def run(self, method, *args, **kwargs):
+        """Chamar um método de importação (as linhas rejeitadas impressas são descartadas)"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            return method(*args, **kwargs)
+
+    def expect(self, label, actual, expected):
+        if actual != expected:
+            self.failures.append(f"{label}: esperado {expected!r}, obtido {actual!r}")
+
+    def close(self):
+        self.session.close()
+        self.engine.dispose()
+
+# ============== CASOS ==============
+
+def _cpf_before_matricula(check, **kwargs):
+    from models import User
+
+    check.session.add(User(nome='A', cpf='111.444.777-35', matricula='M1'))
+    check.session.commit()
+    path = check.write('users.csv', 'nome,cpf,matricula\nB,52998224725,M2\nB-atualizado,52998224725,M1\n')
+    stats = check.run(check.service().import_users_from_csv, path, **kwargs)
+
+    names = {user.matricula: user.nome for user in check.session.query(User)}
+    check.expect('usuários', names, {'M1': 'A', 'M2': 'B-atualizado'})
+    check.expect('criados/atualizados', (stats['created'], stats['updated'], stats['errors']), (1, 1, 0))
+
+@case
+def users_cpf_before_matricula(check):
+    """CPF de uma linha anterior do arquivo tem precedência sobre a matrícula de um usuário já gravado"""
+    _cpf_before_matricula(check)
+
+@case
+def users_cpf_before_matricula_chunked(check):
+    """O mesmo, com cada linha em um bloco (transação) próprio"""
+    _cpf_before_matricula(check, chunk_size=1)
+
+def _nameless_rows(check, **kwargs):
+    from models import EquipmentInstance
+
+    path = check.write_excel('equipamentos.xlsx', [
+        {'nome': 'Notebook', 'patrimonial': 'P1', 'valor': 10, 'data_aquisicao': '2024-01-02'},
+        {'nome': None, 'patrimonial': 'P2', 'valor': 10, 'data_aquisicao': 'data inválida'},
+        {'nome': None, 'patrimonial': 'P3', 'valor': 'abc', 'data_aquisicao': '2024-01-02'},
+    ])
+    stats = check.run(check.service().import_equipment_from_excel, path, **kwargs)
+
+    check.expect('instâncias', [i.patrimonial for i in check.session.query(EquipmentInstance)], ['P1'])
+    # Só o valor inválido conta como erro em linha sem nome; a data nem é lida
+    check.expect('criadas/erros', (stats['instances_created'], stats['errors']), (1, 1))
+
+@case
+def equipment_nameless_rows(check):
+    """Linha sem nome é ignorada sem erro de data, mas o erro de valor é contado"""
+    _nameless_rows(check)
+
+@case
+def equipment_nameless_rows_chunked(check):
+    """O mesmo, lendo a planilha em blocos"""
+    _nameless_rows(check, chunk_size=1)
+
+def _non_finite_valor(check, **kwargs):
+    from models import StockItem
+
+    # ' nan' (com espaço) não está na lista de ausentes do pandas, mas float() o aceita
+    path = check.write('equipamentos.csv', 'nome,patrimonial,valor\nMonitor,P1, nan\nMonitor,P2,inf\nMonitor,P3,5\n')
+    stats = check.run(check.service().import_equipment_from_csv, path, **kwargs)
+
+    values = sorted(check.session.query(StockItem.valor_total), key=lambda row: row[0] or 0)
+    check.expect('valores', [row[0] for row in values], [None, None, 5.0])
+    check.expect('criadas/erros', (stats['instances_created'], stats['errors']), (3, 0))
+
+@case
+def equipment_non_finite_valor(check):
+    """Valor NaN/infinito em texto é gravado como vazio (NULL), sem quebrar o RETURNING"""
+    _non_finite_valor(check)
+
+@case
+def equipment_non_finite_valor_chunked(check):
+    """O mesmo, em blocos"""
+    _non_finite_valor(check, chunk_size=1)
+
+def _excel_missing_values(check, **kwargs):
+    from models import EquipmentInstance, EquipmentType, StockItem
+
+    path = check.write_excel('equipamentos.xlsx', [
+        {'nome': 'Teclado', 'marca': 'N/A', 'modelo': 'NULL', 'patrimonial': 'P1', 'serial': 'nan', 'valor': '#N/A'},
+    ])
+    stats = check.run(check.service().import_equipment_from_excel, path, **kwargs)
+
+    check.expect('tipos', [(t.marca, t.modelo) for t in check.session.query(EquipmentType)], [(None, None)])
+    check.expect('seriais', [i.serial for i in check.session.query(EquipmentInstance)], [None])
+    check.expect('valores', [row[0] for row in check.session.query(StockItem.valor_total)], [0.0])
+    check.expect('criadas/erros', (stats['instances_created'], stats['errors']), (1, 0))
+
+@case
+def excel_missing_values(check):
+    """'N/A', 'NULL', 'nan', '#N/A' em texto na planilha contam como células vazias"""
+    _excel_missing_values(check)
+
+@case
+def excel_missing_values_chunked(check):
+    """O mesmo na leitura em blocos (openpyxl), que não passa pelo pd.read_excel"""
+    _excel_missing_values(check, chunk_size=1)
+
+def _parquet_empty_text(check, **kwargs):
+    from models import User
+
+    path = check.write_parquet('usuarios.parquet', [
+        {'nome': 'A', 'cpf': '11144477735', 'matricula': '', 'cargo': ''},
+        {'nome': 'B', 'cpf': '52998224725', 'matricula': '', 'cargo': 'Analista'},
+    ])
+    stats = check.run(check.service().import_users_from_parquet, path, **kwargs)
+
+    users = [(u.nome, u.matricula, u.cargo) for u in check.session.query(User).order_by(User.nome)]
+    check.expect('usuários', users, [('A', None, None), ('B', None, 'Analista')])
+    check.expect('criados/erros', (stats['created'], stats['errors']), (2, 0))
+
+@case
+def parquet_empty_text(check):
+    """Texto vazio no Parquet conta como célula vazia (matrícula NULL, não '' repetida)"""
+    _parquet_empty_text(check)
+
+@case
+def parquet_empty_text_chunked(check):
+    """O mesmo, lendo o Parquet em blocos"""
+    _parquet_empty_text(check, chunk_size=1)
+
+def _delta_changed_equipment(check, **kwargs):
+    from counters import rebuild_counters, stock_counters
+    from models import EquipmentInstance, EquipmentType, InventoryCounter, StatusEnum, StockItem
+
+    manual = StockItem(equipment_type=EquipmentType(nome='Mouse'), quantidade=1, valor_total=0.0)
+    check.session.add(EquipmentInstance(stock_item=manual, patrimonial='P9'))
+    check.session.flush()
+    rebuild_counters(check.session)
+    check.session.commit()
+    first = [
+        {'nome': 'Mouse', 'patrimonial': 'P1', 'valor': 10, 'status': 'disponível'},
+        {'nome': 'Mouse', 'patrimonial': 'P2', 'valor': 20, 'status': 'disponível'},
+    ]
+    check.run(check.service().import_equipment_from_excel, check.write_excel('a.xlsx', first), delta=True, **kwargs)
+    second = [
+        {'nome': 'Teclado', 'patrimonial': 'P1', 'valor': 15, 'status': 'em manutenção'},
+        first[1],
+        {'nome': 'Mouse', 'patrimonial': 'P3', 'valor': 5, 'status': 'disponível'},
+        {'nome': 'Mouse', 'patrimonial': 'P9', 'valor': 1, 'status': 'disponível'},
+    ]
+    stats = check.run(check.service().import_equipment_from_excel, check.write_excel('b.xlsx', second),
+                      delta=True, **kwargs)
+
+    check.expect('criadas/atualizadas/inalteradas/erros',
+                 (stats['instances_created'], stats['instances_updated'], stats['unchanged'], stats['errors']),
+                 (1, 1, 1, 1))
+    p1 = check.session.query(EquipmentInstance).filter_by(patrimonial='P1').one()
+    check.expect('P1', (p1.stock_item.equipment_type.nome, p1.stock_item.valor_total, p1.status),
+                 ('Teclado', 15.0, StatusEnum.em_manutencao))
+    counters = stock_counters(check.session)
+    by_type = {(c.scope, c.key): (c.count, c.value) for c in check.session.query(InventoryCounter)}
+    rebuild_counters(check.session)
+    check.expect('contadores', counters, stock_counters(check.session))
+    check.expect('contadores por tipo', by_type,
+                 {(c.scope, c.key): (c.count, c.value) for c in check.session.query(InventoryCounter)})
+    check.session.rollback()
+
+@case
+def delta_changed_equipment(check):
+    """Com delta, patrimonial importado antes e alterado no arquivo é atualizado, e não rejeitado"""
+    _delta_changed_equipment(check)
+
+@case
+def delta_changed_equipment_chunked(check):
+    """O mesmo, em blocos"""
+    _delta_changed_equipment(check, chunk_size=1)
+
+@case
+def concurrent_imports_reload_caches(check):
+    """Importação que grava depois de outra recarrega tipos e patrimoniais gravados por ela"""
+    from models import EquipmentInstance, EquipmentType, get_session
+
+    other_session = get_session(check.engine)
+    try:
+        first = check.service()
+        other = check.service()
+        other.session = other_session
+        line = 'nome,marca,modelo,patrimonial\n'
+        check.run(first.import_equipment_from_csv, check.write('a.csv', line + 'Notebook,Dell,X,P1\n'))
+        check.run(other.import_equipment_from_csv, check.write('b.csv', line + 'Notebook,Dell,Y,P2\n'))
+        # Os mapas de `first` são de antes da gravação de `other`
+        stats = check.run(first.import_equipment_from_csv,
+                          check.write('c.csv', line + 'Notebook,Dell,Y,P2\nNotebook,Dell,Y,P3\n'))
+    finally:
+        other_session.close()
+
+    check.expect('tipos', check.session.query(EquipmentType).count(), 2)
+    check.expect('instâncias', sorted(i.patrimonial for i in check.session.query(EquipmentInstance)),
+                 ['P1', 'P2', 'P3'])
+    check.expect('tipos criados/instâncias/erros',
+                 (stats['equipment_types_created'], stats['instances_created'], stats['errors']), (0, 1, 1))
+
+@case
+def chunk_rollback_stats(check):
+    """Bloco que falha é regravado em partes: só a linha com problema é descartada, uma vez"""
+    import csv
+    from models import EquipmentInstance, EquipmentType, ImportCheckpoint
+
+    path = check.write_excel('equipamentos.xlsx', [
+        {'nome': 'Mouse', 'patrimonial': 'P1'},
+        {'nome': 'Mouse', 'patrimonial': 'P1'},
+        {'nome': 'Cabo', 'patrimonial': 'RUIM'},
+        {'nome': None, 'patrimonial': 'P4', 'valor': 'abc'},
+        {'nome': 'Teclado', 'patrimonial': 'P5'},
+    ])
+    report = os.path.join(check.workdir, 'erros.csv')
+    service = check.service(error_report=report)
+
+    # Falha depois da gravação (tipos criados, duplicata já contada) sempre
+    # que a linha RUIM estiver entre os registros gravados
+    insert_equipment = service.insert_equipment
+    def failing(records, *args, **kwargs):
+        insert_equipment(records, *args, **kwargs)
+        if any(record['patrimonial'] == 'RUIM' for record in records):
+            raise Exception('falha simulada')
+    service.insert_equipment = failing
+
+    stats = check.run(service.import_equipment_from_excel, path, chunk_size=10)
+
+    check.expect('tipos gravados', sorted(t.nome for t in check.session.query(EquipmentType)), ['Mouse', 'Teclado'])
+    check.expect('instâncias', sorted(i.patrimonial for i in check.session.query(EquipmentInstance)), ['P1', 'P5'])
+    check.expect('tipos/instâncias/erros',
+                 (stats['equipment_types_created'], stats['instances_created'], stats['errors']), (2, 2, 3))
+    check.expect('descartadas', stats['discarded'], 1)
+    check.expect('checkpoint', [(c.rows_committed, c.finished_at is not None)
+                                for c in check.session.query(ImportCheckpoint)], [(5, True)])
+    with open(report, encoding='utf-8') as f:
+        rows = [(row['linha'], row['erro']) for row in csv.DictReader(f)]
+    check.expect('relatório', [line for line, _ in rows], ['5', '3', '4'])
+    check.expect('descartada', rows[-1][1], 'Linha descartada: falha simulada')
+
+# ============== EXECUÇÃO ==============
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificar casos conhecidos das importações')
+    parser.add_argument('--only', help='casos, separados por vírgula')
+    args = parser.parse_args()
+
+    selected = CASES
+    if args.only:
+        names = args.only.split(',')
+        unknown = [name for name in names if name not in {c.__name__ for c in CASES}]
+        if unknown:
+            parser.error(f"caso desconhecido: {', '.join(unknown)}")
+        selected = [c for c in CASES if c.__name__ in names]
+
+    failed = 0
+    for function in selected:
+        with tempfile.TemporaryDirectory() as workdir:
+            check = Check(workdir)
+            try:
+                function(check)
+            except Exception:
+                check.failures.append(traceback.format_exc().strip())
+            finally:
+                check.close()
+        if check.failures:
+            failed += 1
+            print(f"✗ {function.__name__}: {function.__doc__}")
+            for failure in check.failures:
+                print(f"    {failure}")
+        else:
+            print(f"✓ {function.__name__}")
+
+    if failed:
+        print(f"\n✗ {failed} caso(s) com falha")
+        sys.exit(1)
+    print(f"\n✓ {len(selected)} caso(s) conferido(s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Verificação dos planos de consulta (EXPLAIN QUERY PLAN) das rotas da API
+
+Cria um banco SQLite temporário com dados sintéticos, chama cada rota da
+lista ROUTES pelo cliente de testes do Flask, captura os SELECTs executados
+e roda EXPLAIN QUERY PLAN em cada um. Uma consulta com WHERE que varre uma
+tabela inteira ("SCAN tabela", sem índice) é uma falha, a menos que a rota
+declare o motivo em `allow_scan`. Leituras sem WHERE (listagens completas,
+páginas em ordem de id, agregados do relatório) podem varrer a tabela, assim
+como tabelas pequenas (menos de SMALL_TABLE linhas), que o SQLite
+corretamente prefere varrer. Tipos e itens de estoque crescem com
+`--instances` (ver benchmark_sqlite.populate), então as rotas de estoque e
+de tipos também são verificadas.
+
+    python scripts/check_query_plans.py
+    python scripts/check_query_plans.py --instances 50000 --verbose
+
+Termina com código 1 se alguma consulta não usar índice.
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+USERS_CSV = 'nome,cpf,matricula,cidade\nAna,52998224725,X1,Recife\nBruno,11144477735,X2,Natal\n'
+EQUIPMENT_CSV = 'nome,marca,modelo,patrimonial,serial,valor\nNotebook,Dell,X1,PATCHECK1,SNCHECK1,10\n'
+
+# (método, url, corpo JSON ou arquivo enviado, motivo para aceitar varredura completa)
+ROUTES = [
+    ('GET', '/api/users', None, None),
+    ('GET', '/api/users?limit=50&cursor=100', None, None),
+    ('GET', '/api/users/1', None, None),
+    ('GET', '/api/users?q=Func', None, None),
+    ('GET', '/api/users?city=São Paulo&limit=50', None, None),
+    ('GET', '/api/users?cargo=tec&match=prefix&setor=ti', None, None),
+    ('GET', '/api/equipment-types?q=Tipo', None, None),
+    ('GET', '/api/equipment-types?limit=10', None, None),
+    ('GET', '/api/stock?type_id=3', None, None),
+    ('GET', '/api/stock?limit=20&cursor=5', None, None),
+    ('GET', '/api/stock?available=1&limit=50', None,
+     'página em ordem de id: percorre stock_items pela PK até achar `limit` itens com instância '
+     'disponível (EXISTS pelo índice stock_item_id, status)'),
+    ('GET', '/api/stock?q=Tipo 1&nota_from=2024-01-01&nota_to=2024-12-31', None, None),
+    ('GET', '/api/stock?origem=benchmark&limit=50', None, None),
+    ('GET', '/api/equipment-instances?status=disponivel&limit=100', None, None),
+    ('GET', '/api/equipment-instances?status=alocado&limit=100&cursor=500', None, None),
+    ('GET', '/api/equipment-instances?user_id=1', None, None),
+    ('GET', '/api/equipment-instances?q=PAT0000012', None, None),
+    ('GET', '/api/search?q=Funcionário 12', None, None),
+    ('GET', '/api/search?q=SN00000001&kind=equipment', None, None),
+    ('GET', '/api/facets', None, None),
+    ('GET', '/api/autocomplete/users?q=func', None, None),
+    ('GET', '/api/autocomplete/equipment?q=pat0001&status=disponivel', None, None),
+    ('POST', '/api/assign', {'equipment_instance_id': 11, 'to_user_id': 1}, None),
+    ('POST', '/api/return', {'equipment_instance_id': 11}, None),
+    ('GET', '/api/reports/stock-summary', None, None),
+    ('GET', '/api/reports/user/1', None, None),
+    ('GET', '/api/reports/value-summary', None, None),
+    ('GET', '/api/reports/movements?limit=50', None, None),
+    ('POST', '/api/import/users?sync=1&chunk_size=1', ('users.csv', USERS_CSV), None),
+    ('POST', '/api/import/equipment?sync=1', ('equipment.csv', EQUIPMENT_CSV), None),
+]
+
+SMALL_TABLE = 1000
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+def explain(conn, statement, parameters):
+    """Linhas de detalhe do EXPLAIN QUERY PLAN de um comando"""
+    return [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+
+def full_scans(plan, tables):
+    """Tabelas do modelo varridas por inteiro (sem índice) no plano"""
+    scans = []
+    for detail in plan:
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) in tables:
+            scans.append(match.group(1))
+    return scans
+
+def has_where(statement):
+    return re.search(r'\bWHERE\b', statement, re.IGNORECASE) is not None
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificar o uso de índices pelas rotas da API')
+    parser.add_argument('--users', type=int, default=2000, help='usuários no banco de teste')
+    parser.add_argument('--instances', type=int, default=20000, help='instâncias de equipamento no banco de teste')
+    parser.add_argument('--verbose', action='store_true', help='mostrar o plano de todas as consultas')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='query_plans_')
+    os.chdir(workdir)
+
+    from sqlalchemy import event
+    from config import Config
+    import app as api
+    from benchmark_sqlite import populate
+    from models import Base
+
+    populate(api.engine, args.users, args.instances)
+    with api.engine.begin() as conn:
+        # Metade das instâncias alocada, distribuída entre os usuários, como em um banco em uso
+        conn.exec_driver_sql(
+            "UPDATE equipment_instances SET status = 'alocado', current_user_id = id % ? + 1 WHERE id % 2 = 0",
+            (args.users,)
+        )
+        conn.exec_driver_sql('ANALYZE')
+    # Os dados entraram direto pela engine: remontar os índices do autocompletar
+    api.autocomplete.invalidate()
+    with api.Session() as session:
+        api.autocomplete.rebuild(session)
+
+    captured = []
+
+    @event.listens_for(api.engine, 'before_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    with api.engine.connect() as conn:
+        sizes = {name: conn.exec_driver_sql(f'SELECT COUNT(*) FROM {name}').scalar()
+                 for name in Base.metadata.tables}
+    small = {name for name, size in sizes.items() if size < SMALL_TABLE}
+    tables = set(Base.metadata.tables)
+    client = api.app.test_client()
+    headers = {'X-API-Key': Config.API_KEY}
+    failures = 0
+
+    with api.engine.connect() as conn:
+        for method, url, body, allow_scan in ROUTES:
+            captured.clear()
+            if isinstance(body, tuple):
+                filename, content = body
+                response = client.post(url, headers=headers,
+                                       data={'file': (io.BytesIO(content.encode('utf-8')), filename)})
+            elif method == 'POST':
+                response = client.post(url, headers=headers, json=body)
+            else:
+                response = client.get(url)
+            print(f"{method} {url} -> {response.status_code} ({len(captured)} consultas)")
+
+            seen = set()
+            for statement, parameters in captured:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                plan = explain(conn, statement, parameters)
+                scans = full_scans(plan, tables) if has_where(statement) else []
+                large = [name for name in scans if name not in small]
+                if large and not allow_scan:
+                    failures += 1
+                    status = f"✗ varre {', '.join(large)} sem índice"
+                elif large:
+                    status = f"~ varre {', '.join(large)}: {allow_scan}"
+                elif scans:
+                    status = f"~ varre {', '.join(f'{name} ({sizes[name]} linhas)' for name in scans)}: tabela pequena"
+                else:
+                    status = None
+                if status or args.verbose:
+                    print(f"    {status or '✓'}")
+                    print(f"      {' '.join(statement.split())[:160]}")
+                    for detail in plan:
+                        print(f"        {detail}")
+
+    if failures:
+        print(f"\n✗ {failures} consulta(s) sem índice")
+        sys.exit(1)
+    print("\n✓ Todas as consultas filtradas usam índice")
+
+if __name__ == '__main__':
+    main()